@@ -0,0 +1,238 @@
+import threading
+
+import click
+from flask import request, jsonify
+
+from config import app, db
+from models import Alumni, AlumniRollup, Branche
+from versions import bump_tables, register_dependent, table_versions
+
+
+# Alumni cohort cube: alumni_rollup holds one count per (branch, graduation
+# year, degree, status), moved +1/-1 by triggers on alumni like the branch
+# counters. Each process keeps the rollup joined with the branch provinces in
+# memory and rebuilds it only when the rollup's or the branches' version
+# counters move, so slices are answered without reading the cells again.
+DIMENSIONS = ["branch_id", "province", "year", "degree", "status"]
+DEFAULT_GROUP_BY = ["branch_id", "year", "degree", "status"]
+CUBE_TABLES = [AlumniRollup.__tablename__, Branche.__tablename__]
+# Province of cells whose branch no longer exists
+UNKNOWN_PROVINCE = "unknown"
+# Columns whose changes move an alumni row to another cell
+ROLLUP_COLUMNS = "branch_id, graduation_date, degree, current_status"
+
+register_dependent(Alumni.__tablename__, AlumniRollup.__tablename__)
+
+
+def _year(dialect, column):
+    if dialect == "postgresql":
+        return f"COALESCE(CAST(EXTRACT(YEAR FROM {column}) AS INTEGER), 0)"
+    return f"COALESCE(CAST(strftime('%Y', {column}) AS INTEGER), 0)"
+
+
+def _cell(dialect, row):
+    return (f"branch_id = {row}.branch_id AND year = {_year(dialect, row + '.graduation_date')} "
+            f"AND degree = {row}.degree AND status = {row}.current_status")
+
+
+def _increment(dialect, row):
+    return (f"INSERT INTO alumni_rollup (branch_id, year, degree, status, count) "
+            f"VALUES ({row}.branch_id, {_year(dialect, row + '.graduation_date')}, {row}.degree, "
+            f"{row}.current_status, 1) "
+            f"ON CONFLICT (branch_id, year, degree, status) DO UPDATE SET count = alumni_rollup.count + 1;")
+
+
+def _decrement(dialect, row):
+    return (f"UPDATE alumni_rollup SET count = count - 1 WHERE {_cell(dialect, row)}; "
+            f"DELETE FROM alumni_rollup WHERE {_cell(dialect, row)} AND count <= 0;")
+
+
+def _sqlite_ddl():
+    return [
+        f"CREATE TRIGGER IF NOT EXISTS rollup_alumni_ai AFTER INSERT ON alumni "
+        f"BEGIN {_increment('sqlite', 'NEW')} END",
+        f"CREATE TRIGGER IF NOT EXISTS rollup_alumni_ad AFTER DELETE ON alumni "
+        f"BEGIN {_decrement('sqlite', 'OLD')} END",
+        f"CREATE TRIGGER IF NOT EXISTS rollup_alumni_au AFTER UPDATE OF {ROLLUP_COLUMNS} ON alumni "
+        f"BEGIN {_decrement('sqlite', 'OLD')} {_increment('sqlite', 'NEW')} END",
+    ]
+
+
+def _postgresql_ddl():
+    return [
+        f"CREATE OR REPLACE FUNCTION rollup_alumni() RETURNS trigger AS $$ BEGIN "
+        f"IF TG_OP IN ('UPDATE', 'DELETE') THEN {_decrement('postgresql', 'OLD')} END IF; "
+        f"IF TG_OP IN ('INSERT', 'UPDATE') THEN {_increment('postgresql', 'NEW')} END IF; "
+        f"RETURN NULL; END $$ LANGUAGE plpgsql",
+        "DROP TRIGGER IF EXISTS rollup_alumni ON alumni",
+        f"CREATE TRIGGER rollup_alumni AFTER INSERT OR DELETE OR UPDATE OF {ROLLUP_COLUMNS} "
+        f"ON alumni FOR EACH ROW EXECUTE FUNCTION rollup_alumni()",
+    ]
+
+
+def rebuild_rollup(conn):
+    # Recomputes every cell in one GROUP BY pass over alumni
+    year = _year(conn.dialect.name, "graduation_date")
+    conn.exec_driver_sql("DELETE FROM alumni_rollup")
+    conn.exec_driver_sql(
+        f"INSERT INTO alumni_rollup (branch_id, year, degree, status, count) "
+        f"SELECT branch_id, {year}, degree, current_status, COUNT(*) FROM alumni "
+        f"GROUP BY branch_id, {year}, degree, current_status"
+    )
+
+
+def install_rollup(conn):
+    # Creates the rollup triggers and seeds the cells from the current rows
+    dialect = conn.dialect.name
+    if dialect == "sqlite":
+        statements = _sqlite_ddl()
+    elif dialect == "postgresql":
+        statements = _postgresql_ddl()
+    else:
+        raise RuntimeError(f"Alumni analytics are not supported on {dialect}")
+
+    for statement in statements:
+        conn.exec_driver_sql(statement)
+    rebuild_rollup(conn)
+
+
+class AlumniCube:
+    # Column-wise cells (one tuple per dimension plus counts) with an inverted
+    # index per dimension, so filters are set intersections of cell ids and
+    # only the matching cells are aggregated
+    def __init__(self, cells):
+        self.columns = {dim: tuple(cell[i] for cell in cells) for i, dim in enumerate(DIMENSIONS)}
+        self.counts = tuple(cell[-1] for cell in cells)
+        self.index = {}
+        for dim, column in self.columns.items():
+            positions = self.index[dim] = {}
+            for position, value in enumerate(column):
+                positions.setdefault(value, []).append(position)
+        self._unfiltered = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls):
+        # Cells are (branch_id, province, year, degree, status, count)
+        rows = db.session.query(
+            AlumniRollup.branch_id, Branche.province, AlumniRollup.year,
+            AlumniRollup.degree, AlumniRollup.status, AlumniRollup.count
+        ).outerjoin(Branche, Branche.id == AlumniRollup.branch_id).all()
+        return cls([(b, p or UNKNOWN_PROVINCE, y or None, d, s, c) for b, p, y, d, s, c in rows])
+
+    def _matching(self, filters):
+        selected = None
+        for dim, allowed in filters.items():
+            positions = set()
+            for value, cells in self.index[dim].items():
+                if value is not None and value in allowed:
+                    positions.update(cells)
+            selected = positions if selected is None else selected & positions
+            if not selected:
+                break
+        return selected
+
+    def _aggregate(self, positions, group_by):
+        columns = [self.columns[dim] for dim in group_by]
+        provinces_column, counts = self.columns["province"], self.counts
+        groups, provinces = {}, {}
+        for position in positions:
+            key = tuple(column[position] for column in columns)
+            count = counts[position]
+            groups[key] = groups.get(key, 0) + count
+            province = provinces_column[position]
+            provinces[province] = provinces.get(province, 0) + count
+        return groups, provinces
+
+    def slice(self, filters, group_by):
+        # `filters` maps dimensions to allowed values; returns
+        # ({group key: count}, {province: count}) over the matching cells
+        if filters:
+            return self._aggregate(self._matching(filters) or (), group_by)
+        # Unfiltered rollups are computed once per grouping for the cube's lifetime
+        key = tuple(group_by)
+        result = self._unfiltered.get(key)
+        if result is None:
+            result = self._aggregate(range(len(self.counts)), group_by)
+            with self._lock:
+                self._unfiltered[key] = result
+        return result
+
+
+_cube = (None, None)
+_cube_lock = threading.Lock()
+
+
+def current_cube():
+    # The cube is rebuilt by one thread whenever the version counters of its
+    # tables move, whichever process made the write
+    global _cube
+    key = tuple(sorted((name, version) for name, (version, _) in table_versions(CUBE_TABLES).items()))
+    if _cube[0] == key:
+        return _cube[1]
+    with _cube_lock:
+        if _cube[0] != key:
+            _cube = (key, AlumniCube.load())
+        return _cube[1]
+
+
+class SliceError(ValueError):
+    pass
+
+
+def _values(args, dim, cast=str):
+    raw = [v for v in args.get(dim, "").split(",") if v]
+    try:
+        return {cast(v) for v in raw}
+    except ValueError:
+        raise SliceError(f"{dim} must be a comma-separated list of integers")
+
+
+def parse_slice(args):
+    group_by = [d for d in args.get("group_by", ",".join(DEFAULT_GROUP_BY)).split(",") if d]
+    unknown = [d for d in group_by if d not in DIMENSIONS]
+    if unknown:
+        raise SliceError(f"Unknown dimension: {', '.join(unknown)}")
+
+    filters = {}
+    for dim, cast in (("branch_id", int), ("province", str), ("year", int), ("degree", str), ("status", str)):
+        values = _values(args, dim, cast)
+        if values:
+            filters[dim] = values
+    if "year_from" in args or "year_to" in args:
+        try:
+            low, high = int(args.get("year_from", 0)), int(args.get("year_to", 9999))
+        except ValueError:
+            raise SliceError("year_from and year_to must be integers")
+        # range membership is O(1) for integers
+        years = range(max(low, 1), high + 1)
+        filters["year"] = {y for y in filters["year"] if y in years} if "year" in filters else years
+    return list(dict.fromkeys(group_by)), filters
+
+
+def alumni_analytics():
+    # ?group_by=province,year&branch_id=1,2&year_from=2015&year_to=2020&degree=&status=&province=
+    try:
+        group_by, filters = parse_slice(request.args)
+    except SliceError as e:
+        return jsonify({"error": str(e)}), 400
+
+    groups, provinces = current_cube().slice(filters, group_by)
+    # Unknown values (no graduation date) sort last
+    ordered = sorted(groups.items(), key=lambda item: tuple((v is None, v if v is not None else 0) for v in item[0]))
+    rows = [dict(zip(group_by, key), count=count) for key, count in ordered]
+    return jsonify({
+        "group_by": group_by,
+        "rows": rows,
+        "total": sum(groups.values()),
+        "provinces": provinces
+    })
+
+
+@app.cli.command("rebuild-analytics")
+def rebuild_analytics_command():
+    """Recompute the alumni rollup from the alumni table."""
+    with db.engine.begin() as conn:
+        rebuild_rollup(conn)
+        bump_tables(conn, [AlumniRollup.__tablename__])
+    click.echo("Alumni rollup rebuilt")
@@ -0,0 +1,99 @@
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import request, jsonify, g
+from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
+
+from config import app
+
+
+_serializer = URLSafeTimedSerializer(app.config["SECRET_KEY"], salt="natesa-auth-token")
+
+# token -> (claims, expires_at); verified tokens skip signature checks until they expire
+_verified = OrderedDict()
+_verified_lock = threading.Lock()
+
+
+class InvalidToken(Exception):
+    pass
+
+
+def issue_token(user):
+    ttl = app.config["AUTH_TOKEN_TTL"]
+    claims = {
+        "sub": user.id,
+        "role": user.role,
+        "branch_id": user.branch_id,
+        "exp": int(time.time()) + ttl
+    }
+    return _serializer.dumps(claims), ttl
+
+
+def _cache_get(token):
+    with _verified_lock:
+        entry = _verified.get(token)
+        if entry is None:
+            return None
+        claims, expires_at = entry
+        if expires_at <= time.time():
+            del _verified[token]
+            return None
+        _verified.move_to_end(token)
+        return claims
+
+
+def _cache_put(token, claims):
+    size = app.config["AUTH_TOKEN_CACHE_SIZE"]
+    if size <= 0:
+        return
+    with _verified_lock:
+        _verified[token] = (claims, claims["exp"])
+        _verified.move_to_end(token)
+        while len(_verified) > size:
+            _verified.popitem(last=False)
+
+
+def verify_token(token):
+    claims = _cache_get(token)
+    if claims is not None:
+        return claims
+
+    try:
+        claims = _serializer.loads(token, max_age=app.config["AUTH_TOKEN_TTL"])
+    except SignatureExpired:
+        raise InvalidToken("Token has expired")
+    except BadSignature:
+        raise InvalidToken("Invalid token")
+
+    if claims.get("exp", 0) <= time.time():
+        raise InvalidToken("Token has expired")
+
+    _cache_put(token, claims)
+    return claims
+
+
+def token_required(*roles):
+    # Verifies the bearer token without touching the database and exposes the
+    # claims as g.current_user; optional roles restrict access further
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            header = request.headers.get("Authorization", "")
+            scheme, _, token = header.partition(" ")
+            if scheme.lower() != "bearer" or not token:
+                return jsonify({"error": "Authorization token required"}), 401
+
+            try:
+                claims = verify_token(token.strip())
+            except InvalidToken as e:
+                return jsonify({"error": str(e)}), 401
+
+            if roles and claims["role"] not in roles:
+                return jsonify({"error": "Insufficient permissions"}), 403
+
+            g.current_user = claims
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
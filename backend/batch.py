@@ -0,0 +1,150 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import Response, request, jsonify
+from werkzeug.exceptions import HTTPException
+from werkzeug.test import EnvironBuilder
+
+from config import app, db
+
+
+# /batch runs several GET routes in one round trip. Sub-requests are matched
+# against the URL map and dispatched straight to their view functions, so
+# conditional() and cached_json() still apply, but the per-request hooks
+# (metrics, rate limits, compression) run once for the whole batch.
+# Sequentially they share this request's session: one connection and one read
+# transaction. With "parallel" each runs on a pool thread with its own session;
+# on PostgreSQL those import the batch's exported snapshot.
+FORWARDED_HEADERS = ("Authorization",)
+SUB_REQUEST_HEADERS = ("If-None-Match", "If-Modified-Since")
+# Responses of these endpoints are streamed or never end
+NOT_BATCHABLE = {"batch_requests", "stream_changes", "export_records"}
+RESPONSE_HEADERS = ("ETag", "Last-Modified", "Content-Type")
+
+
+class BatchError(ValueError):
+    pass
+
+
+_executor = None
+
+
+def _pool():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(app.config.get("BATCH_MAX_WORKERS", 4), thread_name_prefix="batch")
+    return _executor
+
+
+def parse_batch(data):
+    items = data.get("requests") if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items:
+        raise BatchError("requests must be a non-empty list")
+    limit = app.config.get("BATCH_MAX_REQUESTS", 20)
+    if len(items) > limit:
+        raise BatchError(f"At most {limit} requests per batch")
+
+    parsed = []
+    for i, item in enumerate(items):
+        if isinstance(item, str):
+            item = {"path": item}
+        if not isinstance(item, dict) or not isinstance(item.get("path"), str) or not item["path"].startswith("/"):
+            raise BatchError(f"requests[{i}] needs a path starting with /")
+        if item.get("method", "GET").upper() != "GET":
+            raise BatchError(f"requests[{i}]: only GET requests can be batched")
+        headers = item.get("headers") or {}
+        parsed.append({
+            "id": str(item.get("id", i)),
+            "path": item["path"],
+            "headers": {k: str(v) for k, v in headers.items() if k in SUB_REQUEST_HEADERS}
+        })
+    return parsed
+
+
+def _environ(item, outer_headers, base_url):
+    path, _, query = item["path"].partition("?")
+    headers = dict(outer_headers, **item["headers"])
+    return EnvironBuilder(path=path, query_string=query, method="GET", headers=headers,
+                          base_url=base_url).get_environ()
+
+
+def _dispatch(environ):
+    # Returns (status, headers, body) of one sub-request
+    with app.request_context(environ) as ctx:
+        if ctx.request.routing_exception is not None:
+            error = ctx.request.routing_exception
+            return getattr(error, "code", 404), {}, jsonify({"error": error.description}).get_data()
+        endpoint = ctx.request.url_rule.endpoint
+        if endpoint in NOT_BATCHABLE:
+            return 400, {}, jsonify({"error": f"{ctx.request.path} cannot be batched"}).get_data()
+        try:
+            response = app.make_response(app.view_functions[endpoint](**ctx.request.view_args))
+        except HTTPException as e:
+            return e.code, {}, jsonify({"error": e.description}).get_data()
+        if response.is_streamed:
+            response.close()
+            return 400, {}, jsonify({"error": f"{ctx.request.path} cannot be batched"}).get_data()
+        headers = {k: response.headers[k] for k in RESPONSE_HEADERS if k in response.headers}
+        return response.status_code, headers, response.get_data()
+
+
+def _begin_snapshot():
+    # Opens the session's transaction so every sub-request reads the same snapshot
+    connection = db.session.connection()
+    dialect = connection.dialect.name
+    if dialect == "postgresql":
+        connection.exec_driver_sql("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+        return connection.exec_driver_sql("SELECT pg_export_snapshot()").scalar()
+    if dialect == "sqlite":
+        # pysqlite only opens transactions for writes; an explicit BEGIN keeps
+        # the read snapshot from the first SELECT until the session ends
+        dbapi_connection = connection.connection.dbapi_connection
+        if not dbapi_connection.in_transaction:
+            connection.exec_driver_sql("BEGIN")
+    return None
+
+
+def _run_in_snapshot(environ, snapshot):
+    # Pool thread: a fresh app context, and so a fresh session, per sub-request
+    with app.app_context():
+        if snapshot is not None:
+            connection = db.session.connection()
+            connection.exec_driver_sql("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+            connection.exec_driver_sql(f"SET TRANSACTION SNAPSHOT '{snapshot}'")
+        return _dispatch(environ)
+
+
+def _encode(item, status, headers, body, mimetype):
+    # Sub-responses are spliced in as raw bytes, not decoded and re-encoded
+    if mimetype != "application/json" or not body:
+        body = app.json.dumps(body.decode() if body else None).encode()
+    head = app.json.dumps({"id": item["id"], "status": status, "headers": headers})
+    return head[:-1].encode() + b',"body":' + body + b"}"
+
+
+def run_batch():
+    # {"requests": [{"id": "users", "path": "/users?fields=id,name"}, "/branches"], "parallel": false}
+    data = request.get_json(silent=True)
+    try:
+        items = parse_batch(data)
+    except BatchError as e:
+        return jsonify({"error": str(e)}), 400
+
+    outer_headers = {k: request.headers[k] for k in FORWARDED_HEADERS if k in request.headers}
+    environs = [_environ(item, outer_headers, request.host_url) for item in items]
+    parallel = bool(data.get("parallel")) and len(items) > 1 and app.config.get("BATCH_MAX_WORKERS", 4) > 0
+
+    snapshot = _begin_snapshot()
+    try:
+        if parallel:
+            results = list(_pool().map(lambda environ: _run_in_snapshot(environ, snapshot), environs))
+        else:
+            results = [_dispatch(environ) for environ in environs]
+    finally:
+        # Ends the read transaction (and releases the exported snapshot)
+        db.session.rollback()
+
+    parts = []
+    for item, (status, headers, body) in zip(items, results):
+        mimetype = headers.get("Content-Type", "application/json").split(";")[0]
+        parts.append(_encode(item, status, headers, body, mimetype))
+    return Response(b'{"responses":[' + b",".join(parts) + b"]}", mimetype="application/json")
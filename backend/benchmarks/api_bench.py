@@ -0,0 +1,421 @@
+# REST API load benchmark: seeds a database with synthetic data, then drives
+# list, detail, login, create and update scenarios from concurrent clients
+# through the Flask test client and/or a real threaded WSGI server. Reports
+# p50/p95/p99 latency, throughput and peak RSS per scenario and writes JSON
+# that can be compared across commits.
+#
+#   python benchmarks/api_bench.py --scale 2 --clients 16 --output results/HEAD.json
+#   python benchmarks/api_bench.py --mode wsgi --scenarios list_users login --compare results/main.json
+#   python benchmarks/api_bench.py --url http://127.0.0.1:8000 --database-url sqlite:////srv/natesa.db
+#
+# Without --database-url a fresh SQLite file in a temporary directory is used.
+# With --url the already-running server is driven instead of an in-process one;
+# point --database-url at the same database so the seeded ids line up.
+import argparse
+import http.client
+import json
+import logging
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Rows per unit of --scale
+SCALE = {"branches": 20, "users": 2000, "alumni": 500, "events": 500, "news": 1000}
+PROVINCES = ['Eastern Cape', 'Free State', 'Gauteng', 'KwaZulu-Natal', 'Limpopo',
+             'Mpumalanga', 'Northern Cape', 'North West', 'Western Cape']
+PASSWORD = "benchmark-password"
+SEED_CHUNK = 1000
+
+
+def seed(counts, rng):
+    from config import db
+    from migrations import upgrade
+    from models import Alumni, Branche, Event, News, User
+    from passwords import hash_password
+
+    upgrade()
+    if db.session.query(User.id).filter(User.email.like("bench%@example.org")).first():
+        print("Database already seeded; reusing it")
+        return
+
+    def insert(model, rows):
+        for start in range(0, len(rows), SEED_CHUNK):
+            db.session.execute(model.__table__.insert(), rows[start:start + SEED_CHUNK])
+
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    insert(Branche, [{"name": f"Branch {i}", "university": f"University {i % 26}",
+                      "province": PROVINCES[i % len(PROVINCES)], "member_count": 0, "alumni_count": 0}
+                     for i in range(counts["branches"])])
+    branch_ids = [row[0] for row in db.session.query(Branche.id)]
+
+    # One hash shared by every user keeps seeding fast; logins still verify it in full
+    password_hash = hash_password(PASSWORD)
+    insert(User, [{"name": f"Member {i}", "email": f"bench{i}@example.org", "password_hash": password_hash,
+                   "role": "member", "branch_id": rng.choice(branch_ids), "is_bec_member": "no",
+                   "bec_position": "no", "nec_position": "N/A", "status": "active"}
+                  for i in range(counts["users"])])
+    user_ids = [row[0] for row in db.session.query(User.id)]
+
+    # One alumni record per user (alumni.user_id is unique)
+    insert(Alumni, [{"user_id": user_id, "branch_id": rng.choice(branch_ids),
+                     "graduation_date": now - timedelta(days=rng.randint(0, 3650)),
+                     "degree": rng.choice(["BSc", "BA", "BCom", "BEd", "MSc"]),
+                     "current_status": rng.choice(["active", "completed", "draft"])}
+                    for user_id in rng.sample(user_ids, min(counts["alumni"], len(user_ids)))])
+    insert(Event, [{"title": f"Event {i}", "date": now + timedelta(days=rng.randint(-180, 180)),
+                    "branch_id": rng.choice(branch_ids), "created_by": "bench",
+                    "event_type": rng.choice(["meeting", "rally", "workshop"])}
+                   for i in range(counts["events"])])
+    insert(News, [{"title": f"News {i}", "content": f"Synthetic article {i}",
+                   "branch_id": rng.choice(branch_ids), "author_id": str(rng.choice(user_ids)),
+                   "publish_date": now - timedelta(minutes=i)}
+                  for i in range(counts["news"])])
+    db.session.commit()
+
+
+def load_ids():
+    from config import db
+    from models import Alumni, Branche, News, User
+
+    return {
+        "users": [row[0] for row in db.session.query(User.id).filter(User.email.like("bench%@example.org"))],
+        "branches": [row[0] for row in db.session.query(Branche.id)],
+        "alumni": [row[0] for row in db.session.query(Alumni.id)],
+        "news": [row[0] for row in db.session.query(News.id)],
+        "emails": [row[0] for row in db.session.query(User.email).filter(User.email.like("bench%@example.org"))],
+    }
+
+
+# Scenarios return (method, path, json body or None) for one request
+def _list_users(ids, rng, n):
+    return "GET", "/users?limit=100", None
+
+
+def _list_news(ids, rng, n):
+    return "GET", "/news?limit=100", None
+
+
+def _list_branches(ids, rng, n):
+    return "GET", "/branches", None
+
+
+def _branch_news(ids, rng, n):
+    return "GET", f"/news/branch/{rng.choice(ids['branches'])}", None
+
+
+def _detail_user(ids, rng, n):
+    return "GET", f"/users/{rng.choice(ids['users'])}", None
+
+
+def _detail_branch(ids, rng, n):
+    return "GET", f"/branches/{rng.choice(ids['branches'])}", None
+
+
+def _login(ids, rng, n):
+    return "POST", "/login", {"email": rng.choice(ids["emails"]), "password": PASSWORD}
+
+
+def _create_news(ids, rng, n):
+    return "POST", "/create_news", {"title": f"Bench {n}", "content": "Load test article",
+                                    "branch_id": rng.choice(ids["branches"]), "author_id": "bench"}
+
+
+def _update_user(ids, rng, n):
+    return "PUT", f"/users/{rng.choice(ids['users'])}", {"name": f"Member {n}"}
+
+
+SCENARIOS = {
+    "list_users": _list_users,
+    "list_news": _list_news,
+    "list_branches": _list_branches,
+    "branch_news": _branch_news,
+    "detail_user": _detail_user,
+    "detail_branch": _detail_branch,
+    "login": _login,
+    "create_news": _create_news,
+    "update_user": _update_user,
+}
+
+
+class TestClientTransport:
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, body):
+        response = self.client.open(path, method=method, json=body)
+        response.get_data()
+        return response.status_code
+
+    def close(self):
+        pass
+
+
+class HTTPTransport:
+    # One keep-alive connection per client thread, reopened after errors
+    def __init__(self, url):
+        parts = urllib.parse.urlsplit(url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.conn = None
+
+    def request(self, method, path, body):
+        if self.conn is None:
+            self.conn = http.client.HTTPConnection(self.host, self.port, timeout=60)
+        headers = {}
+        payload = None
+        if body is not None:
+            payload = json.dumps(body).encode()
+            headers["Content-Type"] = "application/json"
+        try:
+            self.conn.request(method, path, body=payload, headers=headers)
+            response = self.conn.getresponse()
+            response.read()
+            if response.will_close:
+                self.close()
+            return response.status
+        except (OSError, http.client.HTTPException):
+            self.close()
+            return 0
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+class RSSSampler:
+    # Peak resident set size while a scenario runs; /proc where available,
+    # otherwise the process-lifetime maximum from getrusage
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+
+    @staticmethod
+    def current():
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError):
+            maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+    def _loop(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self.current())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.current())
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = max(int(round(pct / 100 * len(sorted_values))) - 1, 0)
+    return sorted_values[min(index, len(sorted_values) - 1)]
+
+
+def run_scenario(name, make_transport, ids, clients, requests_per_client, warmup, seed_value):
+    scenario = SCENARIOS[name]
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    start_barrier = threading.Barrier(clients + 1)
+
+    def worker(index):
+        rng = random.Random(seed_value + index)
+        transport = make_transport()
+        try:
+            for n in range(warmup):
+                transport.request(*scenario(ids, rng, f"w{index}-{n}"))
+            start_barrier.wait()
+            local, failed = [], []
+            for n in range(requests_per_client):
+                method, path, body = scenario(ids, rng, f"{index}-{n}")
+                started = time.perf_counter()
+                status = transport.request(method, path, body)
+                local.append(time.perf_counter() - started)
+                if not 200 <= status < 400:
+                    failed.append(status)
+            with lock:
+                latencies.extend(local)
+                errors.extend(failed)
+        finally:
+            transport.close()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(clients)]
+    for t in threads:
+        t.start()
+    with RSSSampler() as rss:
+        start_barrier.wait()
+        started = time.perf_counter()
+        for t in threads:
+            t.join()
+        wall = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "scenario": name,
+        "clients": clients,
+        "requests": len(latencies),
+        "errors": len(errors),
+        "error_statuses": sorted(set(errors)),
+        "seconds": round(wall, 3),
+        "throughput_rps": round(len(latencies) / wall, 2) if wall else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "max_ms": round(latencies[-1] * 1000, 2) if latencies else 0.0,
+        "peak_rss_mb": round(rss.peak / 2 ** 20, 1),
+    }
+
+
+def start_wsgi_server(app):
+    from werkzeug.serving import make_server
+
+    # Per-request access logging would dominate the measurement
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, name="bench-wsgi", daemon=True)
+    thread.start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = {(r["mode"], r["scenario"]): r for r in json.load(f)["results"]}
+
+    print(f"\nCompared with {baseline_path}:")
+    print(f"{'mode':<12}{'scenario':<16}{'rps':>10}{'Δrps':>9}{'p95 ms':>10}{'Δp95':>9}")
+    for r in results:
+        old = baseline.get((r["mode"], r["scenario"]))
+        if old is None:
+            continue
+
+        def delta(new, before):
+            return f"{(new - before) / before * 100:+.1f}%" if before else "n/a"
+        print(f"{r['mode']:<12}{r['scenario']:<16}{r['throughput_rps']:>10}"
+              f"{delta(r['throughput_rps'], old['throughput_rps']):>9}"
+              f"{r['p95_ms']:>10}{delta(r['p95_ms'], old['p95_ms']):>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the NaTeSA REST API")
+    parser.add_argument("--scale", type=float, default=1.0,
+                        help="Multiplier for the synthetic row counts " + json.dumps(SCALE))
+    for table in SCALE:
+        parser.add_argument(f"--{table}", type=int, help=f"Override the number of {table}")
+    parser.add_argument("--database-url", help="Database to seed and serve (default: temporary SQLite file)")
+    parser.add_argument("--mode", choices=["test-client", "wsgi", "both"], default="both")
+    parser.add_argument("--url", help="Drive an already-running server instead of an in-process one")
+    parser.add_argument("--scenarios", nargs="+", choices=sorted(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200, help="Measured requests per client")
+    parser.add_argument("--warmup", type=int, default=5, help="Unmeasured requests per client")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    parser.add_argument("--compare", help="Print deltas against a previous --output file")
+    args = parser.parse_args()
+
+    tmpdir = None
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    elif "DATABASE_URL" not in os.environ:
+        tmpdir = tempfile.mkdtemp(prefix="natesa-bench-")
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmpdir, 'bench.db')}"
+
+    # One client address would otherwise exhaust the per-IP login/write buckets,
+    # and concurrent logins would be shed by admission control
+    os.environ.setdefault("RATELIMIT_ENABLED", "false")
+    os.environ.setdefault("ADMISSION_ENABLED", "false")
+
+    from main import app
+
+    counts = {t: getattr(args, t) if getattr(args, t) is not None else max(int(n * args.scale), 1)
+              for t, n in SCALE.items()}
+    rng = random.Random(args.seed)
+    with app.app_context():
+        started = time.perf_counter()
+        seed(counts, rng)
+        print(f"Seeded {counts} in {time.perf_counter() - started:.1f}s")
+        ids = load_ids()
+
+    targets = []
+    if args.url:
+        targets.append(("http", lambda: HTTPTransport(args.url)))
+    else:
+        if args.mode in ("test-client", "both"):
+            targets.append(("test-client", lambda: TestClientTransport(app)))
+        if args.mode in ("wsgi", "both"):
+            server, url = start_wsgi_server(app)
+            targets.append(("wsgi", lambda: HTTPTransport(url)))
+
+    results = []
+    for mode, make_transport in targets:
+        for name in args.scenarios:
+            result = {"mode": mode, **run_scenario(name, make_transport, ids, args.clients,
+                                                   args.requests, args.warmup, args.seed)}
+            results.append(result)
+            print(f"{mode:<12}{name:<16}{result['throughput_rps']:>9} rps  "
+                  f"p50 {result['p50_ms']:>8} ms  p95 {result['p95_ms']:>8} ms  "
+                  f"p99 {result['p99_ms']:>8} ms  errors {result['errors']:>4}  "
+                  f"rss {result['peak_rss_mb']} MB")
+
+    if not args.url and args.mode in ("wsgi", "both"):
+        server.shutdown()
+
+    report = {
+        "meta": {
+            "revision": git_revision(),
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "database": "temporary sqlite" if tmpdir else os.environ["DATABASE_URL"].split("@")[-1],
+            "counts": counts,
+            "clients": args.clients,
+            "requests_per_client": args.requests,
+            "warmup": args.warmup,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+
+    from passwords import shutdown_pool
+    shutdown_pool()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+# Login load benchmark: drives POST /login from concurrent clients and reports
+# successful logins per second, with rejected requests counted by status.
+#
+#   python benchmarks/login_bench.py --email a@b.c --password secret
+#   RATELIMIT_ENABLED=false ADMISSION_ENABLED=false python serve.py  # then
+#   python benchmarks/login_bench.py --url http://127.0.0.1:5000 --email ... --password ...
+#
+# Without --url the Flask test client is used in-process against the configured database.
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _client_login(url, payload):
+    if url is None:
+        # Measure hashing throughput, not the per-IP buckets or admission
+        # control shedding concurrent logins; a --url server needs the same
+        # RATELIMIT_ENABLED=false ADMISSION_ENABLED=false environment
+        os.environ.setdefault("RATELIMIT_ENABLED", "false")
+        os.environ.setdefault("ADMISSION_ENABLED", "false")
+        from main import app
+        client = app.test_client()
+
+        def login():
+            return client.post("/login", json=payload).status_code
+        return login
+
+    body = json.dumps(payload).encode()
+
+    def login():
+        req = urllib.request.Request(url.rstrip("/") + "/login", data=body,
+                                     headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(req) as response:
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+    return login
+
+
+def run(url, email, password, clients, requests_per_client):
+    payload = {"email": email, "password": password}
+    latencies = []
+    failures = []
+    lock = threading.Lock()
+
+    def worker():
+        login = _client_login(url, payload)
+        for _ in range(requests_per_client):
+            start = time.perf_counter()
+            status = login()
+            elapsed = time.perf_counter() - start
+            with lock:
+                if status == 200:
+                    latencies.append(elapsed)
+                else:
+                    failures.append(status)
+
+    threads = [threading.Thread(target=worker) for _ in range(clients)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - started
+
+    # Only successful logins count; rejected ones (429, 503) return quickly
+    # and would otherwise inflate the rate
+    latencies.sort()
+    return {
+        "clients": clients,
+        "requests": len(latencies) + len(failures),
+        "logins": len(latencies),
+        "failures": {str(code): failures.count(code) for code in sorted(set(failures))},
+        "seconds": round(wall, 3),
+        "logins_per_second": round(len(latencies) / wall, 2),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 2) if latencies else None,
+        "p95_ms": round(latencies[max(int(len(latencies) * 0.95) - 1, 0)] * 1000, 2) if latencies else None,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure /login throughput")
+    parser.add_argument("--url", help="Base URL of a running server (default: in-process test client)")
+    parser.add_argument("--email", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=25, help="Logins per client")
+    args = parser.parse_args()
+
+    print(json.dumps(run(args.url, args.email, args.password, args.clients, args.requests), indent=2))
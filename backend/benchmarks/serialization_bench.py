@@ -0,0 +1,93 @@
+# Serialization microbenchmark: ORM rows + to_json() + the stdlib JSON provider
+# (the original /users path) versus column tuples + compiled encoders + app.json.
+#
+#   python benchmarks/serialization_bench.py --sizes 1000 10000 100000
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", "sqlite:///:memory:")
+
+from flask.json.provider import DefaultJSONProvider  # noqa: E402
+
+from config import app, db  # noqa: E402
+from models import User  # noqa: E402
+from serialization import columns_for, encode_rows  # noqa: E402
+
+
+def legacy_to_json(user):
+    # to_json() as it was before the fast path: str() around most values
+    return {"id": user.id,
+            "name": user.name,
+            "email": user.email,
+            "role": str(user.role),
+            "branch_id": user.branch_id,
+            "is_bec_member": str(user.is_bec_member),
+            "nec_position": str(user.nec_position),
+            "bec_position": str(user.bec_position),
+            "status": str(user.status)
+            }
+
+
+def seed(count):
+    db.session.query(User).delete()
+    db.session.execute(User.__table__.insert(), [
+        {"name": f"Member {i}", "email": f"member{i}@example.org", "password_hash": "x",
+         "role": "member", "branch_id": i % 50, "is_bec_member": "no", "bec_position": "no",
+         "nec_position": "N/A", "status": "active"}
+        for i in range(count)
+    ])
+    db.session.commit()
+
+
+def legacy_path(provider):
+    users = User.query.all()
+    body = provider.dumps({"users": [legacy_to_json(u) for u in users]})
+    db.session.expunge_all()
+    return body
+
+
+def fast_path():
+    keys = list(User.json_fields)
+    rows = db.session.query(*columns_for(User, keys)).all()
+    return app.json.response({"users": encode_rows(User, keys, rows)}).get_data()
+
+
+def best_of(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def run(sizes, repeat):
+    results = []
+    legacy_provider = DefaultJSONProvider(app)
+    with app.app_context():
+        db.create_all()
+        for size in sizes:
+            seed(size)
+            legacy = best_of(lambda: legacy_path(legacy_provider), repeat)
+            fast = best_of(fast_path, repeat)
+            results.append({
+                "rows": size,
+                "legacy_ms": round(legacy * 1000, 2),
+                "fast_ms": round(fast * 1000, 2),
+                "speedup": round(legacy / fast, 2),
+                "provider": type(app.json).__name__
+            })
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare serialization paths for /users")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(json.dumps(run(args.sizes, args.repeat), indent=2))
@@ -0,0 +1,283 @@
+import json
+
+from flask import request, jsonify
+from sqlalchemy import insert, update
+from sqlalchemy.exc import IntegrityError
+
+from config import app, db
+from jobs import enqueue_many
+from listing import ListQueryError, coerce_value
+from models import User, Branche, Alumni, News
+from passwords import hash_passwords
+
+
+# Per-table rules mirroring the single-record create_* endpoints
+BULK_SPECS = {
+    "users": {
+        "model": User,
+        "key": "email",
+        "required": ['name', 'email', 'password', 'role', 'branch_id'],
+        "fields": ['name', 'email', 'role', 'branch_id', 'is_bec_member',
+                   'bec_position', 'nec_position', 'status'],
+        "defaults": {'is_bec_member': 'no', 'bec_position': 'no',
+                     'nec_position': 'N/A', 'status': 'active'}
+    },
+    "branches": {
+        "model": Branche,
+        "key": "name",
+        "required": ['name', 'university', 'province'],
+        # member_count/alumni_count are maintained by the database, not the client
+        "fields": ['name', 'university', 'province'],
+        "defaults": {}
+    },
+    "alumni": {
+        "model": Alumni,
+        "key": "user_id",
+        "required": ['user_id', 'branch_id', 'degree'],
+        "fields": ['user_id', 'branch_id', 'degree', 'graduation_date', 'current_status'],
+        "defaults": {'current_status': 'draft'}
+    },
+    "news": {
+        "model": News,
+        "key": None,
+        "required": ['title', 'content', 'branch_id', 'author_id'],
+        "fields": ['title', 'content', 'branch_id', 'author_id', 'publish_date'],
+        "defaults": {}
+    }
+}
+
+BULK_MODES = ("create", "update", "upsert")
+
+
+class BulkRowError(ValueError):
+    pass
+
+
+def read_records():
+    # Accepts a JSON array, {"records": [...]} or an NDJSON body
+    if request.mimetype == "application/x-ndjson":
+        records = []
+        for line_no, line in enumerate(request.get_data(as_text=True).splitlines(), 1):
+            if not line.strip():
+                continue
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                raise BulkRowError(f"Invalid JSON on line {line_no}")
+        return records
+
+    if not request.is_json:
+        raise BulkRowError("Request must be JSON or NDJSON")
+
+    data = request.get_json()
+    if isinstance(data, dict):
+        data = data.get("records")
+    if not isinstance(data, list):
+        raise BulkRowError("Body must be an array of records")
+    return data
+
+
+def _values(spec, record, partial):
+    model = spec["model"]
+    values = {}
+    for field in spec["fields"]:
+        if field in record:
+            value = record[field]
+        elif partial:
+            continue
+        else:
+            # Insert mappings share one key set so they can go through executemany
+            value = spec["defaults"].get(field)
+
+        if value is not None:
+            try:
+                value = coerce_value(getattr(model, field), value)
+            except ListQueryError as e:
+                raise BulkRowError(f"{field}: {e}")
+        values[field] = value
+
+    if model is User and "password" in record:
+        if not isinstance(record["password"], str) or not record["password"]:
+            raise BulkRowError("password must be a non-empty string")
+        # Hashed together with the rest of the chunk in _hash_passwords
+        values["password_hash"] = None
+
+    return values
+
+
+def _hash_passwords(records, rows):
+    # `rows` are (index, values) pairs; records[index] holds the plain password
+    pending = [(values, records[index]["password"]) for index, values in rows if "password_hash" in values]
+    hashes = hash_passwords([password for _, password in pending])
+    for (values, _), password_hash in zip(pending, hashes):
+        values["password_hash"] = password_hash
+
+
+def _validate(spec, record, mode):
+    if not isinstance(record, dict):
+        raise BulkRowError("Record must be an object")
+
+    # Ids often arrive as strings (NDJSON/CSV-style clients); the lookups
+    # compare them with the integer primary keys
+    if record.get("id") is not None:
+        try:
+            record["id"] = coerce_value(spec["model"].id, record["id"])
+        except (ListQueryError, TypeError):
+            raise BulkRowError(f"id must be an integer, got {record['id']!r}")
+
+    if mode == "update" and not record.get("id") and not (spec["key"] and record.get(spec["key"])):
+        raise BulkRowError(f"Missing required field: {spec['key'] or 'id'}")
+
+
+def _check_required(spec, record):
+    for field in spec["required"]:
+        if field not in record or not record[field]:
+            raise BulkRowError(f"Missing required field: {field}")
+
+
+def _existing_ids(spec, chunk):
+    # One set-based lookup per chunk instead of a SELECT per record
+    model = spec["model"]
+    ids = {r["id"] for _, r in chunk if r.get("id")}
+    keys = set()
+    if spec["key"] is not None:
+        keys = {r[spec["key"]] for _, r in chunk if r.get(spec["key"])}
+
+    by_id = set()
+    if ids:
+        by_id = {row[0] for row in db.session.query(model.id).filter(model.id.in_(ids))}
+
+    by_key = {}
+    if keys:
+        key_column = getattr(model, spec["key"])
+        by_key = dict(db.session.query(key_column, model.id).filter(key_column.in_(keys)))
+
+    return by_id, by_key
+
+
+def _process_chunk(spec, chunk, mode, results, seen_keys):
+    model = spec["model"]
+    key = spec["key"]
+    by_id, by_key = _existing_ids(spec, chunk)
+
+    inserts = []
+    updates = []
+    for index, record in chunk:
+        try:
+            key_value = record.get(key) if key else None
+            if key_value is not None:
+                if key_value in seen_keys:
+                    raise BulkRowError(f"Duplicate {key} in batch: {key_value}")
+                seen_keys.add(key_value)
+
+            # An explicit id wins; a natural key that belongs to another row is a conflict
+            existing_id = by_key.get(key_value) if key_value is not None else None
+            if record.get("id"):
+                if existing_id is not None and existing_id != record["id"]:
+                    raise BulkRowError(f"{key} {key_value} belongs to another record")
+                existing_id = record["id"] if record["id"] in by_id else None
+
+            if existing_id is not None:
+                if mode == "create":
+                    raise BulkRowError(f"Record with this {key or 'id'} already exists")
+                values = _values(spec, record, partial=True)
+                values["id"] = existing_id
+                updates.append((index, values))
+            else:
+                if mode == "update":
+                    raise BulkRowError("Record not found")
+                _check_required(spec, record)
+                inserts.append((index, _values(spec, record, partial=False)))
+        except BulkRowError as e:
+            results[index] = {"index": index, "status": "error", "error": str(e)}
+
+    records = dict(chunk)
+    _hash_passwords(records, inserts + updates)
+
+    if inserts:
+        statement = insert(model).returning(model.id, sort_by_parameter_order=True)
+        new_ids = db.session.scalars(statement, [values for _, values in inserts]).all()
+        for (index, _), new_id in zip(inserts, new_ids):
+            results[index] = {"index": index, "status": "created", "id": new_id}
+        if model is User:
+            # Same side effect as create_user, committed with the rows
+            enqueue_many("welcome_email", [{"user_id": new_id} for new_id in new_ids])
+
+    # Bulk UPDATE by primary key; group by key set so each group is one executemany.
+    # Edits move the row version like PATCH does, which also changes the row ETag
+    groups = {}
+    for index, values in updates:
+        groups.setdefault(tuple(sorted(values)), []).append((index, values))
+    for group in groups.values():
+        db.session.execute(update(model).values(version=model.version + 1), [values for _, values in group])
+        for index, values in group:
+            results[index] = {"index": index, "status": "updated", "id": values["id"]}
+
+
+def _constraint_error(spec, error):
+    # The database does not say which row of an executemany failed, so the
+    # whole chunk is reported with the reason
+    if "unique" in str(error.orig).lower():
+        return f"Chunk rejected: {spec['key'] or 'value'} already in use"
+    return "Chunk rejected: invalid reference or missing value"
+
+
+def bulk_write(table):
+    spec = BULK_SPECS.get(table)
+    if spec is None:
+        return jsonify({"error": f"Unknown bulk table: {table}"}), 404
+
+    mode = request.args.get("mode", "create")
+    if mode not in BULK_MODES:
+        return jsonify({"error": f"mode must be one of: {', '.join(BULK_MODES)}"}), 400
+
+    try:
+        records = read_records()
+    except BulkRowError as e:
+        return jsonify({"error": str(e)}), 400
+
+    max_records = app.config.get("BULK_MAX_RECORDS", 50000)
+    if len(records) > max_records:
+        return jsonify({"error": f"Batch exceeds {max_records} records"}), 413
+
+    results = [None] * len(records)
+    valid = []
+    for index, record in enumerate(records):
+        try:
+            _validate(spec, record, mode)
+            valid.append((index, record))
+        except BulkRowError as e:
+            results[index] = {"index": index, "status": "error", "error": str(e)}
+
+    chunk_size = app.config.get("BULK_CHUNK_SIZE", 500)
+    seen_keys = set()
+    rejected = False
+    try:
+        # All chunks share one transaction and a single COMMIT; each runs in a
+        # savepoint so a constraint violation only fails its own chunk
+        for start in range(0, len(valid), chunk_size):
+            chunk = valid[start:start + chunk_size]
+            try:
+                with db.session.begin_nested():
+                    _process_chunk(spec, chunk, mode, results, seen_keys)
+            except IntegrityError as e:
+                rejected = True
+                error = _constraint_error(spec, e)
+                for index, _ in chunk:
+                    if results[index] is None or results[index]["status"] != "error":
+                        results[index] = {"index": index, "status": "error", "error": error}
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    summary = {"created": 0, "updated": 0, "error": 0}
+    for result in results:
+        summary[result["status"]] += 1
+
+    return jsonify({
+        "results": results,
+        "created": summary["created"],
+        "updated": summary["updated"],
+        "failed": summary["error"]
+    }), 409 if rejected and not summary["created"] and not summary["updated"] else 200
@@ -0,0 +1,216 @@
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import Response
+
+from compression import compress, encode_response, negotiate
+from config import app
+from versions import respond
+
+
+# Storage backends share a tiny interface: get/set/delete with a TTL.
+class MemoryBackend:
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class LocalSharedClient:
+    # In-process stand-in for a Redis-style client (get/set with ex=/delete),
+    # used when no shared cache server is configured
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.time():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key, value, ex=None):
+        with self._lock:
+            self._data[key] = (value, time.time() + ex if ex else None)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def dbsize(self):
+        return len(self._data)
+
+
+class SharedBackend:
+    def __init__(self, client, prefix="natesa:"):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return pickle.loads(value) if value is not None else None
+
+    def set(self, key, value, ttl=None):
+        self.client.set(self.prefix + key, pickle.dumps(value), ex=ttl)
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def __len__(self):
+        return self.client.dbsize()
+
+
+def _make_backend():
+    if app.config.get("CACHE_BACKEND") == "shared":
+        url = app.config.get("CACHE_SHARED_URL")
+        if url:
+            import redis  # optional dependency, only needed for a real shared cache
+            return SharedBackend(redis.Redis.from_url(url))
+        return SharedBackend(LocalSharedClient())
+    return MemoryBackend(app.config.get("CACHE_MAX_ENTRIES", 1024))
+
+
+class ResponseCache:
+    # Entries never need invalidating: response bodies are keyed on their
+    # version ETag (see cached_response) and everything else expires by TTL
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+
+    def lookup(self, key):
+        value = self.backend.get(key)
+        with self._stats_lock:
+            if value is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return value
+
+    def store(self, key, value, ttl=None):
+        if ttl is None:
+            ttl = app.config.get("CACHE_DEFAULT_TTL", 300)
+        self.backend.set(key, value, ttl)
+
+    def get_or_set(self, key, build, ttl=None):
+        # Returns (value, hit); a plain TTL memo
+        value = self.lookup(key)
+        if value is not None:
+            return value, True
+        value = build()
+        self.store(key, value, ttl)
+        return value, False
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "entries": len(self.backend),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+
+cache = ResponseCache(_make_backend())
+
+# Headers a cached body is not replayed with: hop-by-hop ones, the validators
+# and Cache-Control respond() sets per request, the encoding and length
+# _with_encoding recomputes, and anything per client
+_UNCACHED_HEADERS = frozenset({
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization", "te", "trailer",
+    "transfer-encoding", "upgrade", "content-length", "content-encoding", "vary", "etag",
+    "last-modified", "cache-control", "expires", "set-cookie"
+})
+
+
+def cached_response(tables, ttl=None, mimetype="application/json", condition=None):
+    # conditional() plus a memo of successful responses of one mimetype, keyed on
+    # the ETag: the ETag is derived from the table version counters in the
+    # database, so writes by any process move every worker to new entries and
+    # a body is only ever served with the ETag of the versions it was built at.
+    # `tables` is a list or a callable receiving the view's URL arguments;
+    # `condition`, called the same way, limits caching to some requests (e.g.
+    # first pages).
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            def build(etag):
+                if not app.config.get("CACHE_ENABLED", True) or (condition and not condition(**kwargs)):
+                    return app.make_response(view(*args, **kwargs))
+
+                key = etag
+                entry = cache.lookup(key)
+                if entry is not None:
+                    # The view's own headers (Content-Type, Content-Disposition, ...)
+                    # are stored with the body
+                    body, headers = entry
+                    return _with_encoding(Response(body, headers=headers), key, body, ttl)
+
+                response = app.make_response(view(*args, **kwargs))
+                if response.status_code == 200 and response.mimetype == mimetype:
+                    body = response.get_data()
+                    headers = [(name, value) for name, value in response.headers.items()
+                               if name.lower() not in _UNCACHED_HEADERS]
+                    cache.store(key, (body, headers), ttl)
+                    return _with_encoding(response, key, body, ttl)
+                return response
+
+            names = tables(**kwargs) if callable(tables) else tables
+            return respond(names, build)
+        return wrapper
+    return decorator
+
+
+def cached_json(tables, ttl=None, condition=None):
+    return cached_response(tables, ttl, condition=condition)
+
+
+def _with_encoding(response, key, body, ttl):
+    # Compressed variants live under the plain entry's key, so they follow
+    # the same version and each encoding is computed once per entry
+    encoding = negotiate(len(body))
+    if encoding is None:
+        return response
+    variant_key = f"{key}|{encoding}"
+    compressed = cache.backend.get(variant_key)
+    if compressed is None:
+        compressed = compress(body, encoding)
+        cache.store(variant_key, compressed, ttl)
+    return encode_response(response, encoding, body, compressed)
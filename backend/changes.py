@@ -0,0 +1,271 @@
+import json
+import threading
+import time
+from collections import deque
+
+from flask import Response, request, jsonify, stream_with_context
+from sqlalchemy import delete, func, select
+
+from config import app, db
+from models import Branche, Change, Event, News, User
+from versions import on_tables_committed
+
+
+# Change feed: triggers on the watched tables append (kind, op, id, branch) rows
+# to `changes`, so ORM, bulk and Core writes are all captured in the writer's
+# transaction. One poller thread per process copies new rows into a ring buffer
+# and wakes the /changes/stream clients, which only read memory while idle.
+# Each open stream holds a server thread; thousands of idle subscribers need
+# the gevent worker class (`flask serve --worker-class gevent`).
+# (kind, model, branch column)
+WATCHED = [
+    ("news", News, "branch_id"),
+    ("event", Event, "branch_id"),
+    ("user", User, "branch_id"),
+    ("branch", Branche, "id"),
+]
+KINDS = [kind for kind, _, _ in WATCHED]
+
+# How long a missing seq is waited for before it is treated as a rollback;
+# PostgreSQL can commit a lower sequence value after a higher one
+GAP_TIMEOUT = 2.0
+
+
+def _watched_columns(model):
+    # Columns clients can see; e.g. password rehashes are not a change. The edit
+    # version only moves together with the columns it versions.
+    return ", ".join(c for c in dict.fromkeys(model.json_fields.values()) if c != "version")
+
+
+def _sqlite_ddl():
+    statements = []
+    for kind, model, branch in WATCHED:
+        table = model.__tablename__
+        insert = ("INSERT INTO changes (kind, op, record_id, branch_id, old_branch_id, created_at) "
+                  "VALUES ('{kind}', '{op}', {row}.id, {row}.{branch}, {old}, CURRENT_TIMESTAMP);")
+        statements += [
+            f'CREATE TRIGGER IF NOT EXISTS change_{kind}_ai AFTER INSERT ON "{table}" BEGIN '
+            + insert.format(kind=kind, op="insert", row="NEW", branch=branch, old="NULL") + " END",
+            f'CREATE TRIGGER IF NOT EXISTS change_{kind}_ad AFTER DELETE ON "{table}" BEGIN '
+            + insert.format(kind=kind, op="delete", row="OLD", branch=branch, old="NULL") + " END",
+            f'CREATE TRIGGER IF NOT EXISTS change_{kind}_au AFTER UPDATE OF {_watched_columns(model)} '
+            f'ON "{table}" BEGIN '
+            + insert.format(kind=kind, op="update", row="NEW", branch=branch, old=f"OLD.{branch}") + " END",
+        ]
+    return statements
+
+
+def _postgresql_ddl():
+    statements = []
+    for kind, model, branch in WATCHED:
+        table = model.__tablename__
+        insert = ("INSERT INTO changes (kind, op, record_id, branch_id, old_branch_id, created_at) "
+                  "VALUES ('{kind}', '{op}', {row}.id, {row}.{branch}, {old}, now() AT TIME ZONE 'utc');")
+        statements += [
+            f"CREATE OR REPLACE FUNCTION log_change_{kind}() RETURNS trigger AS $$ BEGIN "
+            f"IF TG_OP = 'DELETE' THEN "
+            + insert.format(kind=kind, op="delete", row="OLD", branch=branch, old="NULL") +
+            f" ELSIF TG_OP = 'UPDATE' THEN "
+            + insert.format(kind=kind, op="update", row="NEW", branch=branch, old=f"OLD.{branch}") +
+            f" ELSE "
+            + insert.format(kind=kind, op="insert", row="NEW", branch=branch, old="NULL") +
+            f" END IF; RETURN NULL; END $$ LANGUAGE plpgsql",
+            f'DROP TRIGGER IF EXISTS log_change_{kind} ON "{table}"',
+            f'CREATE TRIGGER log_change_{kind} AFTER INSERT OR DELETE OR UPDATE OF {_watched_columns(model)} '
+            f'ON "{table}" FOR EACH ROW EXECUTE FUNCTION log_change_{kind}()',
+        ]
+    return statements
+
+
+def install_change_log(conn):
+    # Creates the change log triggers; idempotent
+    dialect = conn.dialect.name
+    if dialect == "sqlite":
+        statements = _sqlite_ddl()
+    elif dialect == "postgresql":
+        statements = _postgresql_ddl()
+    else:
+        raise RuntimeError(f"The change feed is not supported on {dialect}")
+
+    for statement in statements:
+        conn.exec_driver_sql(statement)
+
+
+def _delta(row):
+    delta = {"seq": row.seq, "kind": row.kind, "op": row.op, "id": row.record_id, "branch_id": row.branch_id}
+    if row.old_branch_id is not None and row.old_branch_id != row.branch_id:
+        delta["old_branch_id"] = row.old_branch_id
+    return delta
+
+
+def _read_changes(conn, after, limit):
+    table = Change.__table__
+    return conn.execute(
+        select(table).where(table.c.seq > after).order_by(table.c.seq).limit(limit)
+    ).all()
+
+
+class ChangeFeed:
+    def __init__(self, size):
+        self._buffer = deque(maxlen=size)
+        self._cond = threading.Condition()
+        self._wakeup = threading.Event()
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._gap_since = None
+        self._pruned_at = time.monotonic()
+        self.last_seq = 0
+
+    def start(self):
+        # The poller starts with the first subscriber of this process
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            with db.engine.connect() as conn:
+                self.last_seq = conn.execute(select(func.max(Change.seq))).scalar() or 0
+            self._thread = threading.Thread(target=self._loop, name="change-feed", daemon=True)
+            self._thread.start()
+
+    def wake(self):
+        if self._thread is not None:
+            self._wakeup.set()
+
+    def _loop(self):
+        with app.app_context():
+            while True:
+                self._wakeup.wait(app.config.get("CHANGES_POLL_INTERVAL", 1.0))
+                self._wakeup.clear()
+                try:
+                    self.refresh()
+                    self._prune()
+                except Exception as e:
+                    print("Error reading change feed:", str(e))
+
+    def refresh(self):
+        with db.engine.connect() as conn:
+            rows = _read_changes(conn, self.last_seq, app.config.get("CHANGES_BATCH_SIZE", 1000))
+
+        accepted = []
+        expected = self.last_seq + 1
+        for row in rows:
+            if row.seq != expected:
+                if self._gap_since is None:
+                    self._gap_since = time.monotonic()
+                if time.monotonic() - self._gap_since < GAP_TIMEOUT:
+                    break
+            self._gap_since = None
+            accepted.append(_delta(row))
+            expected = row.seq + 1
+
+        if accepted:
+            with self._cond:
+                self._buffer.extend(accepted)
+                self.last_seq = accepted[-1]["seq"]
+                self._cond.notify_all()
+        if len(rows) == len(accepted) == app.config.get("CHANGES_BATCH_SIZE", 1000):
+            self._wakeup.set()
+
+    def _prune(self):
+        interval = app.config.get("CHANGES_PRUNE_INTERVAL", 300)
+        if time.monotonic() - self._pruned_at < interval:
+            return
+        self._pruned_at = time.monotonic()
+        keep_after = self.last_seq - app.config.get("CHANGES_RETENTION", 100000)
+        if keep_after > 0:
+            with db.engine.begin() as conn:
+                conn.execute(delete(Change.__table__).where(Change.__table__.c.seq <= keep_after))
+
+    def since(self, cursor):
+        # Buffered changes after `cursor`, or None when the buffer no longer reaches back that far
+        with self._cond:
+            if cursor >= self.last_seq:
+                return []
+            if not self._buffer or cursor < self._buffer[0]["seq"] - 1:
+                return None
+            newer = []
+            for delta in reversed(self._buffer):
+                if delta["seq"] <= cursor:
+                    break
+                newer.append(delta)
+            return newer[::-1]
+
+    def wait(self, cursor, timeout):
+        with self._cond:
+            return self._cond.wait_for(lambda: self.last_seq > cursor, timeout)
+
+
+feed = ChangeFeed(app.config.get("CHANGES_BUFFER_SIZE", 10000))
+
+
+@on_tables_committed
+def _wake_feed(tables):
+    # Local writes are delivered at once; other processes' on the next poll
+    if any(model.__tablename__ in tables for _, model, _ in WATCHED):
+        feed.wake()
+
+
+def _backfill(cursor, limit):
+    # Changes older than the ring buffer come from the table; None when pruned
+    oldest = db.session.query(func.min(Change.seq)).scalar()
+    if oldest is None or cursor < oldest - 1:
+        return None
+    rows = _read_changes(db.session.connection(), cursor, limit)
+    return [_delta(row) for row in rows if row.seq <= feed.last_seq]
+
+
+def _event(delta):
+    return f"id: {delta['seq']}\nevent: change\ndata: {json.dumps(delta, separators=(',', ':'))}\n\n"
+
+
+def change_stream():
+    # ?branch_id=1,2&kind=news,event&since=<seq>; reconnecting EventSource
+    # clients resume from the Last-Event-ID header instead
+    kinds = {k for k in request.args.get("kind", "").split(",") if k}
+    unknown = kinds - set(KINDS)
+    if unknown:
+        return jsonify({"error": f"Unknown kind: {', '.join(sorted(unknown))}"}), 400
+    try:
+        branch_ids = {int(b) for b in request.args.get("branch_id", "").split(",") if b}
+        since = request.headers.get("Last-Event-ID") or request.args.get("since")
+        since = int(since) if since is not None else None
+    except ValueError:
+        return jsonify({"error": "branch_id and since must be integers"}), 400
+
+    feed.start()
+    cursor = since if since is not None else feed.last_seq
+    heartbeat = app.config.get("CHANGES_HEARTBEAT", 15)
+    deadline = time.monotonic() + app.config.get("CHANGES_STREAM_MAX_SECONDS", 3600)
+    batch = app.config.get("CHANGES_BATCH_SIZE", 1000)
+
+    def matches(delta):
+        if kinds and delta["kind"] not in kinds:
+            return False
+        return not branch_ids or delta["branch_id"] in branch_ids or delta.get("old_branch_id") in branch_ids
+
+    def generate():
+        nonlocal cursor
+        yield f"retry: {app.config.get('CHANGES_RETRY_MS', 3000)}\n\n"
+        while time.monotonic() < deadline:
+            changes = feed.since(cursor)
+            if changes is None:
+                changes = _backfill(cursor, batch)
+                # Hand the pooled connection back before idling
+                db.session.close()
+                if changes is None:
+                    # Too far behind: the client must reload and continue from here
+                    cursor = feed.last_seq
+                    yield f"id: {cursor}\nevent: reset\ndata: {{}}\n\n"
+                    continue
+
+            for delta in changes:
+                cursor = delta["seq"]
+                if matches(delta):
+                    yield _event(delta)
+
+            if not changes and not feed.wait(cursor, heartbeat):
+                yield ": keep-alive\n\n"
+
+    response = Response(stream_with_context(generate()), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
@@ -0,0 +1,73 @@
+import gzip
+
+from flask import request
+
+from config import app
+from metrics import METRICS, Counter
+
+try:
+    import brotli
+except ImportError:  # optional: only gzip is offered without it
+    brotli = None
+
+
+# Response bodies are compressed in an after_request hook when the client
+# accepts it and the body is large enough to be worth it. cached_json() keeps
+# the compressed variants next to the plain body so cache hits skip this work.
+# Importing metrics first registers its hooks first, so it sees the wire size.
+COMPRESSED = Counter("http_compressed_responses_total", "Responses sent compressed", ("encoding",))
+COMPRESSION_BYTES = Counter("http_compression_bytes_total", "Body bytes before and after compression",
+                            ("encoding", "stage"))
+METRICS += [COMPRESSED, COMPRESSION_BYTES]
+
+
+def _encodings():
+    # Server preference when the client weighs both equally
+    return (["br"] if brotli is not None else []) + ["gzip"]
+
+
+def compressible(response):
+    return (200 <= response.status_code < 300 and response.status_code != 204
+            and response.mimetype in app.config.get("COMPRESSION_MIMETYPES", ())
+            and not response.is_streamed and not response.direct_passthrough)
+
+
+def negotiate(size):
+    # Returns the encoding to use for a body of `size` bytes, or None
+    if not app.config.get("COMPRESSION_ENABLED", True) or size is None \
+            or size < app.config.get("COMPRESSION_MIN_SIZE", 1024):
+        return None
+    return request.accept_encodings.best_match(_encodings())
+
+
+def compress(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=app.config.get("COMPRESSION_BROTLI_QUALITY", 4))
+    # mtime=0 keeps the output identical for identical bodies
+    return gzip.compress(body, compresslevel=app.config.get("COMPRESSION_GZIP_LEVEL", 6), mtime=0)
+
+
+def encode_response(response, encoding, body, compressed):
+    if len(compressed) >= len(body):
+        return response
+    response.set_data(compressed)
+    response.headers["Content-Encoding"] = encoding
+    COMPRESSED.inc(encoding)
+    COMPRESSION_BYTES.inc(encoding, "in", amount=len(body))
+    COMPRESSION_BYTES.inc(encoding, "out", amount=len(compressed))
+    return response
+
+
+@app.after_request
+def _compress_response(response):
+    if not compressible(response):
+        return response
+    response.vary.add("Accept-Encoding")
+    if "Content-Encoding" in response.headers:
+        return response
+
+    encoding = negotiate(response.content_length)
+    if encoding is None:
+        return response
+    body = response.get_data()
+    return encode_response(response, encoding, body, compress(body, encoding))
@@ -1,13 +1,192 @@
+import os
+import tempfile
+
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
 
+from database import database_uri, engine_options
+
 app = Flask(__name__)
 CORS(app)
 
 
+def _persisted_secret_key():
+    # Generated once into the instance folder, so every worker process and
+    # restart signs with the same key. Published with a hard link, which fails
+    # when another process got there first, so readers never see a partial file.
+    path = os.path.join(app.instance_path, "secret_key")
+    if not os.path.exists(path):
+        os.makedirs(app.instance_path, exist_ok=True)
+        fd, temp = tempfile.mkstemp(dir=app.instance_path)
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(os.urandom(32).hex())
+            os.link(temp, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.unlink(temp)
+    with open(path) as f:
+        return f.read().strip()
+
+
+# Signing key for session tokens. Deployments spanning several hosts must set
+# SECRET_KEY; otherwise the key persisted in instance/secret_key is used.
+app.config["SECRET_KEY"] = os.environ.get("SECRET_KEY") or _persisted_secret_key()
+# Token lifetime in seconds and the number of verified tokens kept in memory
+app.config["AUTH_TOKEN_TTL"] = int(os.environ.get("AUTH_TOKEN_TTL", 3600))
+app.config["AUTH_TOKEN_CACHE_SIZE"] = 1024
+
+
 # Configure database
-app.config["SQLALCHEMY_DATABASE_URI"]= "sqlite:///mydatabase.db"
+app.config["SQLALCHEMY_DATABASE_URI"] = database_uri()
+app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(app.config["SQLALCHEMY_DATABASE_URI"])
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 
+# Seconds the /stats aggregates may be served from memory (0 disables caching)
+app.config["STATS_CACHE_TTL"] = 30
+
+# Response cache: "memory" (per-process TTL+LRU) or "shared" (CACHE_SHARED_URL,
+# e.g. redis://, or an in-process stand-in when unset)
+app.config["CACHE_ENABLED"] = os.environ.get("CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+app.config["CACHE_BACKEND"] = os.environ.get("CACHE_BACKEND", "memory")
+app.config["CACHE_SHARED_URL"] = os.environ.get("CACHE_SHARED_URL")
+app.config["CACHE_DEFAULT_TTL"] = 300
+app.config["CACHE_MAX_ENTRIES"] = 1024
+
+# Response compression (compression.py): gzip, plus brotli when the package is
+# installed, for bodies of at least COMPRESSION_MIN_SIZE bytes
+app.config["COMPRESSION_ENABLED"] = os.environ.get("COMPRESSION_ENABLED", "true").lower() in ("1", "true", "yes")
+app.config["COMPRESSION_MIN_SIZE"] = 1024
+app.config["COMPRESSION_GZIP_LEVEL"] = int(os.environ.get("COMPRESSION_GZIP_LEVEL", 6))
+app.config["COMPRESSION_BROTLI_QUALITY"] = int(os.environ.get("COMPRESSION_BROTLI_QUALITY", 4))
+app.config["COMPRESSION_MIMETYPES"] = ["application/json", "application/x-ndjson", "text/csv",
+                                       "text/plain", "text/calendar", "text/html"]
+
+# Rate limits (ratelimit.py) as "count/period" token buckets, period being
+# second/minute/hour/day or "<n>s". "memory" buckets are per process; "shared"
+# uses RATELIMIT_SHARED_URL (redis://) so all workers draw from one bucket.
+app.config["RATELIMIT_ENABLED"] = os.environ.get("RATELIMIT_ENABLED", "true").lower() in ("1", "true", "yes")
+app.config["RATELIMIT_BACKEND"] = os.environ.get("RATELIMIT_BACKEND", "memory")
+app.config["RATELIMIT_SHARED_URL"] = os.environ.get("RATELIMIT_SHARED_URL", os.environ.get("CACHE_SHARED_URL"))
+app.config["RATELIMIT_MAX_KEYS"] = 100000
+app.config["RATELIMIT_LOGIN_IP"] = "20/minute"
+app.config["RATELIMIT_LOGIN_ACCOUNT"] = "10/minute"
+app.config["RATELIMIT_SIGNUP"] = "10/hour"
+app.config["RATELIMIT_WRITES"] = "120/minute"
+
+# Use orjson for app.json when it is installed
+app.config["JSON_FAST_PROVIDER"] = True
+
+# Seconds between background recounts of Branche.member_count/alumni_count (0 disables)
+app.config["BRANCH_COUNT_RECONCILE_INTERVAL"] = int(os.environ.get("BRANCH_COUNT_RECONCILE_INTERVAL", 3600))
+
+# Background job queue (jobs.py): worker threads, idle poll interval, retries
+# with exponential backoff (JOB_RETRY_BASE * 2^attempt seconds), the age at
+# which a 'running' job is considered abandoned, and how long completed jobs are
+# kept (swept by idle workers every JOB_SWEEP_INTERVAL seconds)
+app.config["JOB_WORKERS"] = int(os.environ.get("JOB_WORKERS", 2))
+app.config["JOB_POLL_INTERVAL"] = 1.0
+app.config["JOB_MAX_ATTEMPTS"] = 5
+app.config["JOB_RETRY_BASE"] = 2
+app.config["JOB_TIMEOUT"] = 300
+app.config["JOB_FANOUT_BATCH"] = 500
+app.config["JOB_RETENTION"] = int(os.environ.get("JOB_RETENTION", 7 * 86400))
+app.config["JOB_SWEEP_INTERVAL"] = 600
+
+# Outgoing mail for job handlers; without MAIL_SERVER emails are only logged
+app.config["MAIL_SERVER"] = os.environ.get("MAIL_SERVER")
+app.config["MAIL_PORT"] = int(os.environ.get("MAIL_PORT", 587))
+app.config["MAIL_USE_TLS"] = os.environ.get("MAIL_USE_TLS", "true").lower() in ("1", "true", "yes")
+app.config["MAIL_USERNAME"] = os.environ.get("MAIL_USERNAME")
+app.config["MAIL_PASSWORD"] = os.environ.get("MAIL_PASSWORD")
+app.config["MAIL_FROM"] = os.environ.get("MAIL_FROM", "no-reply@natesa.org")
+
+# Request metrics (metrics.py): log requests issuing more SQL statements than this
+app.config["METRICS_NPLUS1_THRESHOLD"] = int(os.environ.get("METRICS_NPLUS1_THRESHOLD", 20))
+
+# Production server (serve.py, `flask serve`): pre-forked worker processes with
+# a bounded thread pool each ("sync") or a gevent loop ("gevent"). Workers are
+# recycled after SERVE_MAX_REQUESTS (+ random jitter) requests and killed when
+# they miss their heartbeat, or a request has been running in the app, for
+# SERVE_TIMEOUT seconds (streamed bodies such as /changes/stream are exempt).
+app.config["SERVE_BIND"] = os.environ.get("SERVE_BIND", "127.0.0.1:8000")
+app.config["SERVE_WORKERS"] = int(os.environ.get("SERVE_WORKERS", os.cpu_count() or 1))
+app.config["SERVE_THREADS"] = int(os.environ.get("SERVE_THREADS", 8))
+app.config["SERVE_WORKER_CLASS"] = os.environ.get("SERVE_WORKER_CLASS", "sync")
+app.config["SERVE_WORKER_CONNECTIONS"] = 1000
+app.config["SERVE_MAX_REQUESTS"] = int(os.environ.get("SERVE_MAX_REQUESTS", 10000))
+app.config["SERVE_MAX_REQUESTS_JITTER"] = 1000
+app.config["SERVE_TIMEOUT"] = int(os.environ.get("SERVE_TIMEOUT", 30))
+app.config["SERVE_GRACEFUL_TIMEOUT"] = 30
+app.config["SERVE_KEEPALIVE"] = 5
+app.config["SERVE_BACKLOG"] = 2048
+
+# Admission control for expensive endpoints (hashing, bulk writes), per process.
+# Admitted and queued requests each hold a server thread, so together they get
+# SERVE_THREADS minus ADMISSION_RESERVED_THREADS; the reserved threads stay free
+# for cheap reads, /api/health and /metrics. A third of that share may queue
+# (for at most ADMISSION_QUEUE_TIMEOUT seconds), the rest runs; anything beyond
+# gets a 503. Under the gevent worker the same numbers bound CPU-heavy work.
+def admission_limits(threads):
+    share = max(1, threads - app.config["ADMISSION_RESERVED_THREADS"])
+    queue = int(os.environ.get("ADMISSION_MAX_QUEUE", share // 3))
+    concurrent = int(os.environ.get("ADMISSION_MAX_CONCURRENT", max(1, share - queue)))
+    return concurrent, queue
+
+
+app.config["ADMISSION_ENABLED"] = os.environ.get("ADMISSION_ENABLED", "true").lower() in ("1", "true", "yes")
+app.config["ADMISSION_RESERVED_THREADS"] = int(os.environ.get("ADMISSION_RESERVED_THREADS", 2))
+app.config["ADMISSION_MAX_CONCURRENT"], app.config["ADMISSION_MAX_QUEUE"] = admission_limits(app.config["SERVE_THREADS"])
+app.config["ADMISSION_QUEUE_TIMEOUT"] = 2.0
+app.config["ADMISSION_RETRY_AFTER"] = 1
+
+# Page size bounds for the keyset-paginated list endpoints. Requests without
+# ?limit= or ?after= still get the whole list; a cursor alone pages by the default
+app.config["LIST_DEFAULT_LIMIT"] = 100
+app.config["LIST_MAX_LIMIT"] = 1000
+
+# /events/upcoming: events per branch by default and at most; the .ics feeds
+# include events from this many days back
+app.config["EVENTS_UPCOMING_DEFAULT"] = 3
+app.config["EVENTS_UPCOMING_MAX"] = 50
+app.config["ICS_PAST_DAYS"] = 365
+
+# /changes/stream: deltas kept in memory per process, rows kept in the change
+# table for reconnecting clients, poll interval for other processes' writes,
+# keep-alive comment interval and the longest a stream stays open (seconds)
+app.config["CHANGES_BUFFER_SIZE"] = 10000
+app.config["CHANGES_RETENTION"] = 100000
+app.config["CHANGES_PRUNE_INTERVAL"] = 300
+app.config["CHANGES_BATCH_SIZE"] = 1000
+app.config["CHANGES_POLL_INTERVAL"] = float(os.environ.get("CHANGES_POLL_INTERVAL", 1.0))
+app.config["CHANGES_HEARTBEAT"] = 15
+app.config["CHANGES_STREAM_MAX_SECONDS"] = 3600
+app.config["CHANGES_RETRY_MS"] = 3000
+
+# /batch: sub-requests per call, and pool threads for "parallel" batches
+app.config["BATCH_MAX_REQUESTS"] = 20
+app.config["BATCH_MAX_WORKERS"] = int(os.environ.get("BATCH_MAX_WORKERS", 4))
+
+# Largest page /search returns
+app.config["SEARCH_MAX_LIMIT"] = 100
+
+# Rows fetched per server-side cursor batch by the streaming export
+app.config["EXPORT_BATCH_SIZE"] = 1000
+
+# Bulk write endpoints: records per executemany chunk and per request
+app.config["BULK_CHUNK_SIZE"] = 500
+app.config["BULK_MAX_RECORDS"] = 50000
+
+# Password hashing: werkzeug method string (algorithm and cost), e.g.
+# "pbkdf2:sha256:600000" or "scrypt:32768:8:1". Stored hashes under another
+# method are rehashed at login.
+app.config["PASSWORD_HASH_METHOD"] = os.environ.get("PASSWORD_HASH_METHOD", "pbkdf2:sha256:600000")
+# Size of the process pool hashing runs on (0 hashes inline in the request thread)
+app.config["PASSWORD_HASH_WORKERS"] = int(os.environ.get("PASSWORD_HASH_WORKERS", min(4, os.cpu_count() or 1)))
+app.config["PASSWORD_HASH_QUEUE_FACTOR"] = 4
+app.config["PASSWORD_HASH_TIMEOUT"] = 10
+app.config["PASSWORD_HASH_MP_CONTEXT"] = "spawn"
+
 db = SQLAlchemy(app)
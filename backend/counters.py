@@ -0,0 +1,142 @@
+import threading
+import time
+
+import click
+from sqlalchemy import func, or_, select, update
+
+from config import app, db
+from models import User, Alumni, Branche
+from versions import register_dependent
+
+
+# Branche.member_count / alumni_count are maintained by triggers on the source
+# tables: +1/-1 per insert/delete and a move when branch_id changes, so reads
+# stay O(1). (source table, counter column)
+COUNTED = [
+    ("user", "member_count"),
+    ("alumni", "alumni_count"),
+]
+
+for _source, _ in COUNTED:
+    register_dependent(_source, Branche.__tablename__)
+
+
+def _adjust(row, column, delta):
+    return (f"UPDATE branche SET {column} = COALESCE({column}, 0) {delta} 1 "
+            f"WHERE id = {row}.branch_id;")
+
+
+def _sqlite_ddl():
+    statements = []
+    for source, column in COUNTED:
+        statements += [
+            f'CREATE TRIGGER IF NOT EXISTS count_{source}_ai AFTER INSERT ON "{source}" '
+            f'BEGIN {_adjust("NEW", column, "+")} END',
+            f'CREATE TRIGGER IF NOT EXISTS count_{source}_ad AFTER DELETE ON "{source}" '
+            f'BEGIN {_adjust("OLD", column, "-")} END',
+            f'CREATE TRIGGER IF NOT EXISTS count_{source}_au AFTER UPDATE OF branch_id ON "{source}" '
+            f'WHEN OLD.branch_id IS NOT NEW.branch_id '
+            f'BEGIN {_adjust("OLD", column, "-")} {_adjust("NEW", column, "+")} END',
+        ]
+    return statements
+
+
+def _postgresql_ddl():
+    statements = []
+    for source, column in COUNTED:
+        statements += [
+            f"CREATE OR REPLACE FUNCTION count_{source}() RETURNS trigger AS $$ BEGIN "
+            f"IF TG_OP = 'DELETE' OR (TG_OP = 'UPDATE' AND OLD.branch_id IS DISTINCT FROM NEW.branch_id) THEN "
+            f"{_adjust('OLD', column, '-')} END IF; "
+            f"IF TG_OP = 'INSERT' OR (TG_OP = 'UPDATE' AND OLD.branch_id IS DISTINCT FROM NEW.branch_id) THEN "
+            f"{_adjust('NEW', column, '+')} END IF; "
+            f"RETURN NULL; END $$ LANGUAGE plpgsql",
+            f'DROP TRIGGER IF EXISTS count_{source} ON "{source}"',
+            f'CREATE TRIGGER count_{source} AFTER INSERT OR DELETE OR UPDATE OF branch_id '
+            f'ON "{source}" FOR EACH ROW EXECUTE FUNCTION count_{source}()',
+        ]
+    return statements
+
+
+def install_counters(conn):
+    # Creates the counter triggers and seeds the counts from the current rows
+    dialect = conn.dialect.name
+    if dialect == "sqlite":
+        statements = _sqlite_ddl()
+    elif dialect == "postgresql":
+        statements = _postgresql_ddl()
+    else:
+        raise RuntimeError(f"Branch counters are not supported on {dialect}")
+
+    for statement in statements:
+        conn.exec_driver_sql(statement)
+    for source, column in COUNTED:
+        conn.exec_driver_sql(
+            f'UPDATE branche SET {column} = '
+            f'(SELECT COUNT(*) FROM "{source}" WHERE "{source}".branch_id = branche.id)'
+        )
+
+
+def reconcile_branch_counts(apply=True):
+    # Recomputes every counter in one GROUP BY pass per source table and
+    # reports branches whose stored value had drifted
+    members = dict(db.session.query(User.branch_id, func.count(User.id)).group_by(User.branch_id))
+    alumni = dict(db.session.query(Alumni.branch_id, func.count(Alumni.id)).group_by(Alumni.branch_id))
+
+    drift = []
+    for branch_id, member_count, alumni_count in db.session.query(
+            Branche.id, Branche.member_count, Branche.alumni_count):
+        expected = {"member_count": members.get(branch_id, 0), "alumni_count": alumni.get(branch_id, 0)}
+        stored = {"member_count": member_count, "alumni_count": alumni_count}
+        if expected != stored:
+            drift.append({"branch_id": branch_id, "stored": stored, "expected": expected})
+
+    if apply and drift:
+        # The fix is recomputed inside one UPDATE rather than written from the
+        # counts read above, so trigger updates committed in between are kept
+        members = select(func.count(User.id)).where(User.branch_id == Branche.id).scalar_subquery()
+        alumni = select(func.count(Alumni.id)).where(Alumni.branch_id == Branche.id).scalar_subquery()
+        db.session.execute(
+            update(Branche)
+            .where(or_(Branche.member_count.is_distinct_from(members),
+                       Branche.alumni_count.is_distinct_from(alumni)))
+            .values(member_count=members, alumni_count=alumni)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+    else:
+        db.session.rollback()
+
+    return drift
+
+
+def start_reconciler(interval=None):
+    # Periodic background reconcile; returns the thread, or None when disabled
+    interval = interval if interval is not None else app.config.get("BRANCH_COUNT_RECONCILE_INTERVAL", 0)
+    if interval <= 0:
+        return None
+
+    def loop():
+        while True:
+            time.sleep(interval)
+            try:
+                with app.app_context():
+                    drift = reconcile_branch_counts()
+                if drift:
+                    print(f"Reconciled branch counters for {len(drift)} branches:", drift)
+            except Exception as e:
+                print("Error reconciling branch counters:", str(e))
+
+    thread = threading.Thread(target=loop, name="branch-count-reconciler", daemon=True)
+    thread.start()
+    return thread
+
+
+@app.cli.command("reconcile-counts")
+@click.option("--dry-run", is_flag=True, help="Report drift without fixing it.")
+def reconcile_counts_command(dry_run):
+    """Recompute Branche.member_count and alumni_count."""
+    drift = reconcile_branch_counts(apply=not dry_run)
+    for d in drift:
+        click.echo(f"branch {d['branch_id']}: stored {d['stored']} expected {d['expected']}")
+    click.echo(f"{len(drift)} branches {'drifted' if dry_run else 'reconciled'}")
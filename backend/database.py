@@ -0,0 +1,58 @@
+import os
+import sqlite3
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, make_url
+
+
+# Applied to every new SQLite connection. WAL lets readers run alongside a
+# writer, synchronous=NORMAL is durable under WAL without an fsync per commit,
+# and busy_timeout makes writers wait instead of failing with "database is locked".
+SQLITE_PRAGMAS = {
+    "journal_mode": os.environ.get("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "busy_timeout": int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", 5000)),
+    "mmap_size": int(os.environ.get("SQLITE_MMAP_SIZE", 256 * 1024 * 1024)),
+    # Negative values are KiB rather than pages
+    "cache_size": int(os.environ.get("SQLITE_CACHE_SIZE", -64000)),
+    "temp_store": os.environ.get("SQLITE_TEMP_STORE", "MEMORY"),
+}
+
+
+def database_uri():
+    # DATABASE_URL switches backends (e.g. postgresql+psycopg://...) without code changes
+    uri = os.environ.get("DATABASE_URL", "sqlite:///mydatabase.db")
+    if uri.startswith("postgres://"):
+        # Heroku-style URLs use a scheme SQLAlchemy no longer accepts
+        uri = "postgresql://" + uri[len("postgres://"):]
+    return uri
+
+
+def engine_options(uri):
+    url = make_url(uri)
+    options = {
+        "pool_pre_ping": os.environ.get("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes"),
+        "pool_recycle": int(os.environ.get("DB_POOL_RECYCLE", 1800)),
+    }
+
+    in_memory = url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")
+    if not in_memory:
+        # In-memory SQLite uses a per-thread singleton pool that takes no sizing
+        options["pool_size"] = int(os.environ.get("DB_POOL_SIZE", 10))
+        options["max_overflow"] = int(os.environ.get("DB_MAX_OVERFLOW", 20))
+        options["pool_timeout"] = int(os.environ.get("DB_POOL_TIMEOUT", 30))
+
+    return options
+
+
+@event.listens_for(Engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
@@ -0,0 +1,121 @@
+from datetime import datetime, timedelta, timezone
+
+from flask import Response, request, jsonify
+from sqlalchemy import func
+
+from config import app, db
+from listing import ListQueryError, selected_fields
+from models import Branche, Event
+from serialization import encode_rows
+
+
+def _utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def upcoming_events():
+    # Next N events of every branch in one statement: ROW_NUMBER() over each
+    # branch's future events, walked in (branch_id, date) index order
+    args = request.args
+    try:
+        keys = selected_fields(Event, args)
+        per_branch = int(args.get("limit", app.config.get("EVENTS_UPCOMING_DEFAULT", 3)))
+        branch_ids = [int(b) for b in args.get("branch_id", "").split(",") if b]
+    except ListQueryError as e:
+        return jsonify({"error": str(e)}), 400
+    except ValueError:
+        return jsonify({"error": "limit and branch_id must be integers"}), 400
+    if per_branch < 1:
+        return jsonify({"error": "limit must be positive"}), 400
+    per_branch = min(per_branch, app.config.get("EVENTS_UPCOMING_MAX", 50))
+
+    rank = func.row_number().over(partition_by=Event.branch_id, order_by=(Event.date, Event.id)).label("rank")
+    # The outer ORDER BY needs branch_id, date and id whatever fields were asked for
+    selected = [Event.json_fields[k] for k in keys]
+    inner = dict.fromkeys(selected + ["branch_id", "date", "id"])
+    ranked = db.session.query(*(getattr(Event, name) for name in inner), rank).filter(Event.date >= _utcnow())
+    if branch_ids:
+        ranked = ranked.filter(Event.branch_id.in_(branch_ids))
+    ranked = ranked.subquery()
+
+    columns = [ranked.c[name] for name in selected]
+    rows = db.session.query(*columns) \
+        .filter(ranked.c.rank <= per_branch) \
+        .order_by(ranked.c.branch_id, ranked.c.date, ranked.c.id).all()
+    events = encode_rows(Event, keys, rows)
+
+    return jsonify({
+        "events": events,
+        "count": len(events),
+        "per_branch": per_branch
+    })
+
+
+def _ics_text(value):
+    # RFC 5545 TEXT escaping
+    return str(value).replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,") \
+        .replace("\r\n", "\\n").replace("\n", "\\n")
+
+
+def _ics_line(line):
+    # Lines are folded at 75 octets, continuation lines start with a space
+    encoded = line.encode()
+    if len(encoded) <= 75:
+        return line + "\r\n"
+    parts = []
+    while encoded:
+        size = 75 if not parts else 74
+        # Never split a UTF-8 sequence
+        while size < len(encoded) and (encoded[size] & 0xC0) == 0x80:
+            size -= 1
+        parts.append(encoded[:size].decode())
+        encoded = encoded[size:]
+    return "\r\n ".join(parts) + "\r\n"
+
+
+def _ics_time(value):
+    return value.strftime("%Y%m%dT%H%M%SZ")
+
+
+def _vevent(event_id, title, date, created_by, event_type, stamp):
+    lines = [
+        "BEGIN:VEVENT",
+        f"UID:event-{event_id}@natesa",
+        f"DTSTAMP:{stamp}",
+        f"DTSTART:{_ics_time(date)}",
+        f"SUMMARY:{_ics_text(title)}",
+        f"CATEGORIES:{_ics_text(event_type)}",
+        f"DESCRIPTION:{_ics_text(f'{event_type} organised by {created_by}')}",
+        "END:VEVENT",
+    ]
+    return "".join(_ics_line(line) for line in lines)
+
+
+def branch_calendar(branch_id):
+    # iCalendar feed of a branch's events from ICS_PAST_DAYS ago onwards,
+    # rendered row by row from the (branch_id, date) index
+    branch = db.session.query(Branche.name).filter(Branche.id == branch_id).first()
+    if branch is None:
+        return jsonify({"error": "Branch not found"}), 404
+
+    since = _utcnow() - timedelta(days=app.config.get("ICS_PAST_DAYS", 365))
+    rows = db.session.query(Event.id, Event.title, Event.date, Event.created_by, Event.event_type) \
+        .filter(Event.branch_id == branch_id, Event.date >= since) \
+        .order_by(Event.date, Event.id) \
+        .execution_options(yield_per=app.config.get("EXPORT_BATCH_SIZE", 1000))
+
+    stamp = _ics_time(_utcnow())
+    parts = [_ics_line(line) for line in (
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        "PRODID:-//NaTeSA//Branch events//EN",
+        "CALSCALE:GREGORIAN",
+        "METHOD:PUBLISH",
+        f"X-WR-CALNAME:{_ics_text(f'NaTeSA {branch.name}')}",
+    )]
+    parts += [_vevent(*row, stamp) for row in rows]
+    parts.append(_ics_line("END:VCALENDAR"))
+
+    response = Response("".join(parts), mimetype="text/calendar")
+    response.headers["Content-Disposition"] = f'inline; filename="branch-{branch_id}.ics"'
+    return response
@@ -0,0 +1,74 @@
+import csv
+import io
+import json
+from datetime import date, datetime
+from itertools import chain
+
+from flask import Response, request, jsonify, stream_with_context
+
+from config import app
+from listing import ListQueryError, build_list_query, selected_fields
+from models import User, Alumni, News
+
+
+EXPORTABLE = {
+    "users": User,
+    "alumni": Alumni,
+    "news": News
+}
+
+
+def _encode_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def _ndjson_rows(keys, rows):
+    for row in rows:
+        item = {k: _encode_value(v) for k, v in zip(keys, row)}
+        yield json.dumps(item, separators=(",", ":")) + "\n"
+
+
+def _csv_rows(keys, rows):
+    # Reuse one small buffer so each chunk is encoded and flushed independently
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    # The header goes out as its own chunk, so an empty export still has one
+    for line in chain([keys], ([_encode_value(v) for v in row] for row in rows)):
+        writer.writerow(line)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+
+
+def export_table(name):
+    model = EXPORTABLE.get(name)
+    if model is None:
+        return jsonify({"error": f"Unknown export table: {name}"}), 404
+
+    fmt = request.args.get("format", "ndjson").lower()
+    if fmt not in ("ndjson", "csv"):
+        return jsonify({"error": "format must be ndjson or csv"}), 400
+
+    args = request.args
+    try:
+        keys = selected_fields(model, args)
+        query = build_list_query(model, args, keys)
+    except ListQueryError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # yield_per streams from a server-side cursor instead of buffering the result set
+    rows = query.yield_per(app.config.get("EXPORT_BATCH_SIZE", 1000))
+
+    if fmt == "csv":
+        body = _csv_rows(keys, rows)
+        mimetype = "text/csv"
+    else:
+        body = _ndjson_rows(keys, rows)
+        mimetype = "application/x-ndjson"
+
+    response = Response(stream_with_context(body), mimetype=mimetype)
+    response.headers["Content-Disposition"] = f"attachment; filename={name}.{fmt}"
+    return response
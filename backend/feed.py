@@ -0,0 +1,75 @@
+import heapq
+
+from flask import request, jsonify
+
+from listing import ListQueryError, build_list_query, next_cursor, page_limit, selected_fields
+from models import News
+from serialization import encode_rows
+
+
+# News feeds are newest first by (publish_date, id) with "<date>,<id>" keyset
+# cursors, each page read straight off the matching index.
+FEED_ORDER = "-publish_date"
+
+
+def _feed_keys(args):
+    keys = selected_fields(News, args)
+    if "publish_date" not in keys:
+        keys.append("publish_date")
+    return keys
+
+
+def _page(args, keys, limit, branch_id=None):
+    feed_args = {"order": FEED_ORDER}
+    if branch_id is not None:
+        feed_args["branch_id"] = str(branch_id)
+    if "after" in args:
+        feed_args["after"] = args["after"]
+    query = build_list_query(News, feed_args, keys)
+    return query.all() if limit is None else query.limit(limit + 1).all()
+
+
+def _respond(keys, rows, limit):
+    has_more = limit is not None and len(rows) > limit
+    items = encode_rows(News, keys, rows[:limit])
+    return jsonify({
+        "news": items,
+        "count": len(items),
+        "next_cursor": next_cursor(items[-1], "publish_date") if has_more else None
+    })
+
+
+def branch_feed(branch_id):
+    # ?limit=&after=&fields=
+    try:
+        keys = _feed_keys(request.args)
+        limit = page_limit(request.args)
+        rows = _page(request.args, keys, limit, branch_id)
+    except ListQueryError as e:
+        return jsonify({"error": str(e)}), 400
+    return _respond(keys, rows, limit)
+
+
+def national_feed():
+    # ?branch_id=1,2,3 merges one index-ordered page per branch; without it
+    # the whole table is read in (publish_date, id) index order
+    try:
+        keys = _feed_keys(request.args)
+        limit = page_limit(request.args)
+        branch_ids = sorted({int(b) for b in request.args.get("branch_id", "").split(",") if b})
+    except ListQueryError as e:
+        return jsonify({"error": str(e)}), 400
+    except ValueError:
+        return jsonify({"error": "branch_id must be a comma-separated list of integers"}), 400
+
+    try:
+        if not branch_ids:
+            rows = _page(request.args, keys, limit)
+        else:
+            date_index, id_index = keys.index("publish_date"), keys.index("id")
+            pages = [_page(request.args, keys, limit, b) for b in branch_ids]
+            merged = heapq.merge(*pages, key=lambda row: (row[date_index], row[id_index]), reverse=True)
+            rows = list(merged) if limit is None else [row for _, row in zip(range(limit + 1), merged)]
+    except ListQueryError as e:
+        return jsonify({"error": str(e)}), 400
+    return _respond(keys, rows, limit)
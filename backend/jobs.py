@@ -0,0 +1,297 @@
+import json
+import random
+import smtplib
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from email.message import EmailMessage
+
+from sqlalchemy import case, delete, func, insert, select, update
+
+from config import app, db
+from models import Job, News, User
+from versions import on_tables_committed
+
+
+# Slow side effects run off the request path. enqueue() adds the job row to the
+# caller's session, so it is committed (or rolled back) together with the write
+# that caused it; worker threads claim due jobs with a single UPDATE ... RETURNING.
+HANDLERS = {}
+
+_wakeup = threading.Event()
+_stop = threading.Event()
+_workers = []
+_swept_at = float("-inf")
+_sweep_lock = threading.Lock()
+
+
+def _utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def job_handler(kind):
+    def decorator(fn):
+        HANDLERS[kind] = fn
+        return fn
+    return decorator
+
+
+def enqueue(kind, payload=None, delay=0, max_attempts=None):
+    if kind not in HANDLERS:
+        raise ValueError(f"Unknown job kind: {kind}")
+
+    now = _utcnow()
+    job = Job(
+        kind=kind,
+        payload=json.dumps(payload or {}),
+        status='queued',
+        attempts=0,
+        max_attempts=max_attempts or app.config.get("JOB_MAX_ATTEMPTS", 5),
+        run_at=now + timedelta(seconds=delay),
+        created_at=now
+    )
+    db.session.add(job)
+    return job
+
+
+def enqueue_many(kind, payloads):
+    # One executemany INSERT on the caller's session, e.g. per bulk-write chunk
+    if kind not in HANDLERS:
+        raise ValueError(f"Unknown job kind: {kind}")
+    now = _utcnow()
+    rows = [{"kind": kind, "payload": json.dumps(payload), "status": 'queued', "attempts": 0,
+             "max_attempts": app.config.get("JOB_MAX_ATTEMPTS", 5), "run_at": now, "created_at": now}
+            for payload in payloads]
+    if rows:
+        db.session.execute(insert(Job), rows)
+
+
+@on_tables_committed
+def _wake_workers(tables):
+    if Job.__tablename__ in tables:
+        _wakeup.set()
+
+
+def _claim(conn):
+    table = Job.__table__
+    now = _utcnow()
+    candidate = select(table.c.id) \
+        .where(table.c.status == 'queued', table.c.run_at <= now) \
+        .order_by(table.c.run_at, table.c.id) \
+        .limit(1)
+    if conn.dialect.name == "postgresql":
+        candidate = candidate.with_for_update(skip_locked=True)
+
+    return conn.execute(
+        update(table)
+        .where(table.c.id == candidate.scalar_subquery(), table.c.status == 'queued')
+        .values(status='running', attempts=table.c.attempts + 1, started_at=now)
+        .returning(table.c.id, table.c.kind, table.c.payload, table.c.attempts, table.c.max_attempts)
+    ).first()
+
+
+def _finish(job_id, values):
+    table = Job.__table__
+    with db.engine.begin() as conn:
+        conn.execute(update(table).where(table.c.id == job_id).values(**values))
+
+
+def _run(job):
+    job_id, kind, payload, attempts, max_attempts = job
+
+    try:
+        handler = HANDLERS.get(kind)
+        if handler is None:
+            raise RuntimeError(f"No handler registered for {kind}")
+        with app.app_context():
+            handler(**json.loads(payload))
+    except Exception as e:
+        if attempts < max_attempts:
+            # Exponential backoff with jitter: base * 2^(attempt-1)
+            delay = app.config.get("JOB_RETRY_BASE", 2) * 2 ** (attempts - 1)
+            delay *= random.uniform(0.8, 1.2)
+            _finish(job_id, {"status": 'queued', "run_at": _utcnow() + timedelta(seconds=delay),
+                             "last_error": str(e)[:1000]})
+        else:
+            _finish(job_id, {"status": 'failed', "finished_at": _utcnow(), "last_error": str(e)[:1000]})
+        print(f"Job {job_id} ({kind}) attempt {attempts} failed:", str(e))
+        return
+
+    _finish(job_id, {"status": 'done', "finished_at": _utcnow(), "last_error": None})
+
+
+def _worker_loop():
+    with app.app_context():
+        _poll_jobs()
+
+
+def _poll_jobs():
+    poll = app.config.get("JOB_POLL_INTERVAL", 1.0)
+    while not _stop.is_set():
+        try:
+            with db.engine.begin() as conn:
+                job = _claim(conn)
+        except Exception as e:
+            print("Error claiming job:", str(e))
+            job = None
+
+        if job is None:
+            _sweep()
+            _wakeup.wait(poll)
+            _wakeup.clear()
+            continue
+        _run(job)
+
+
+def _sweep():
+    # Idle workers delete completed jobs past JOB_RETENTION, at most once per
+    # JOB_SWEEP_INTERVAL per process; failed jobs are kept for inspection
+    global _swept_at
+    with _sweep_lock:
+        if time.monotonic() - _swept_at < app.config.get("JOB_SWEEP_INTERVAL", 600):
+            return
+        _swept_at = time.monotonic()
+    try:
+        purge_completed_jobs()
+    except Exception as e:
+        print("Error purging completed jobs:", str(e))
+
+
+def purge_completed_jobs(retention=None):
+    # Returns the number of 'done' jobs deleted
+    retention = retention if retention is not None else app.config.get("JOB_RETENTION", 7 * 86400)
+    table = Job.__table__
+    cutoff = _utcnow() - timedelta(seconds=retention)
+    with db.engine.begin() as conn:
+        return conn.execute(
+            delete(table).where(table.c.status == 'done', table.c.finished_at < cutoff)
+        ).rowcount
+
+
+def recover_stale_jobs():
+    # Jobs left 'running' by a crashed process go back on the queue
+    table = Job.__table__
+    cutoff = _utcnow() - timedelta(seconds=app.config.get("JOB_TIMEOUT", 300))
+    with db.engine.begin() as conn:
+        return conn.execute(
+            update(table)
+            .where(table.c.status == 'running', table.c.started_at < cutoff)
+            .values(status='queued', run_at=_utcnow())
+        ).rowcount
+
+
+def start_workers(count=None):
+    count = count if count is not None else app.config.get("JOB_WORKERS", 2)
+    if count <= 0 or _workers:
+        return _workers
+
+    with app.app_context():
+        recover_stale_jobs()
+
+    _stop.clear()
+    for i in range(count):
+        thread = threading.Thread(target=_worker_loop, name=f"job-worker-{i}", daemon=True)
+        thread.start()
+        _workers.append(thread)
+    return _workers
+
+
+def stop_workers(timeout=None):
+    _stop.set()
+    _wakeup.set()
+    for thread in _workers:
+        thread.join(timeout)
+    _workers.clear()
+
+
+def _seconds(dialect, start, end):
+    if dialect == "postgresql":
+        return func.extract("epoch", end - start)
+    return (func.julianday(end) - func.julianday(start)) * 86400.0
+
+
+def queue_stats():
+    # Read from the jobs table, so every process reports the same numbers;
+    # wait and run times cover the jobs still retained (see JOB_RETENTION)
+    depth = dict(db.session.query(Job.status, func.count(Job.id)).group_by(Job.status))
+    oldest = db.session.query(func.min(Job.run_at)).filter(Job.status == 'queued').scalar()
+
+    dialect = db.engine.dialect.name
+    wait = _seconds(dialect, Job.run_at, Job.started_at)
+    run = _seconds(dialect, Job.started_at, Job.finished_at)
+    retried, avg_wait, max_wait, avg_run, max_run = db.session.query(
+        func.sum(case((Job.status == 'queued', Job.attempts), else_=Job.attempts - 1)),
+        func.avg(wait), func.max(wait), func.avg(run), func.max(run)
+    ).filter(Job.attempts > 0).one()
+
+    return {
+        "depth": {status: depth.get(status, 0) for status in ('queued', 'running', 'done', 'failed')},
+        "oldest_queued_age_seconds": round(max((_utcnow() - oldest).total_seconds(), 0.0), 3) if oldest else 0.0,
+        "processed": depth.get('done', 0),
+        "failed": depth.get('failed', 0),
+        "retried": int(retried or 0),
+        "avg_wait_seconds": round(float(avg_wait or 0), 4),
+        "max_wait_seconds": round(float(max_wait or 0), 4),
+        "avg_run_seconds": round(float(avg_run or 0), 4),
+        "max_run_seconds": round(float(max_run or 0), 4)
+    }
+
+
+@contextmanager
+def _mailer():
+    # One SMTP connection per job; without MAIL_SERVER messages are only logged
+    server = app.config.get("MAIL_SERVER")
+    if not server:
+        sent = []
+        yield lambda to, subject, body: sent.append(to)
+        if sent:
+            print(f"MAIL_SERVER not configured; skipped {len(sent)} email(s)")
+        return
+
+    with smtplib.SMTP(server, app.config.get("MAIL_PORT", 25), timeout=30) as smtp:
+        if app.config.get("MAIL_USE_TLS"):
+            smtp.starttls()
+        if app.config.get("MAIL_USERNAME"):
+            smtp.login(app.config["MAIL_USERNAME"], app.config.get("MAIL_PASSWORD", ""))
+
+        def send(to, subject, body):
+            message = EmailMessage()
+            message["From"] = app.config.get("MAIL_FROM", "no-reply@natesa.org")
+            message["To"] = to
+            message["Subject"] = subject
+            message.set_content(body)
+            smtp.send_message(message)
+        yield send
+
+
+@job_handler("welcome_email")
+def send_welcome_email(user_id):
+    user = db.session.get(User, user_id)
+    if user is None:
+        return
+    with _mailer() as send:
+        send(user.email, "Welcome to NaTeSA",
+             f"Hi {user.name},\n\nYour NaTeSA account is ready. You can now sign in.\n")
+
+
+@job_handler("news_fanout")
+def fan_out_news(news_id, after=0):
+    # One job per batch of recipients, in id order: the job for the next batch
+    # is enqueued only once this one is sent, so a retry resends one batch at
+    # most instead of starting over
+    news = db.session.get(News, news_id)
+    if news is None:
+        return
+
+    batch = app.config.get("JOB_FANOUT_BATCH", 500)
+    recipients = db.session.query(User.id, User.email) \
+        .filter(User.branch_id == news.branch_id, User.status == 'active', User.id > after) \
+        .order_by(User.id).limit(batch).all()
+    with _mailer() as send:
+        for _, email in recipients:
+            send(email, f"NaTeSA news: {news.title}", news.content)
+
+    if len(recipients) == batch:
+        enqueue("news_fanout", {"news_id": news_id, "after": recipients[-1][0]})
+        db.session.commit()
@@ -0,0 +1,159 @@
+from datetime import datetime
+
+from flask import request, jsonify
+from sqlalchemy import and_, or_
+
+from config import app, db
+from serialization import columns_for, encode_rows
+
+
+class ListQueryError(ValueError):
+    pass
+
+
+def coerce_value(column, value):
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        return value
+
+    if python_type is datetime:
+        return parse_date(value)
+    if python_type is int:
+        try:
+            return int(value)
+        except ValueError:
+            raise ListQueryError(f"Invalid integer value: {value}")
+    return value
+
+
+def parse_date(value):
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).replace(tzinfo=None)
+    except ValueError:
+        raise ListQueryError(f"Invalid date value: {value}")
+
+
+def selected_fields(model, args):
+    fields = args.get("fields")
+    if not fields:
+        return list(model.json_fields)
+
+    keys = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [k for k in keys if k not in model.json_fields]
+    if unknown:
+        raise ListQueryError(f"Unknown fields: {', '.join(unknown)}")
+
+    # The cursor is the id, so it is always part of the projection
+    if "id" not in keys:
+        keys.insert(0, "id")
+    return keys
+
+
+def page_limit(args):
+    # None without ?limit= or ?after=: the full list, as before pagination existed
+    if "limit" not in args and "after" not in args:
+        return None
+    default = app.config.get("LIST_DEFAULT_LIMIT", 100)
+    maximum = app.config.get("LIST_MAX_LIMIT", 1000)
+    try:
+        limit = int(args.get("limit", default))
+    except ValueError:
+        raise ListQueryError("limit must be an integer")
+    if limit < 1:
+        raise ListQueryError("limit must be positive")
+    return min(limit, maximum)
+
+
+def ordering(model, args):
+    # ?order=id|-id|<date field>|-<date field>; returns (date key or None, descending)
+    order = args.get("order", "id")
+    descending = order.startswith("-")
+    key = order[1:] if descending else order
+    if key == "id":
+        return None, descending
+    if model.date_field and model.json_fields.get(key) == model.date_field:
+        return key, descending
+    raise ListQueryError(f"Cannot order by {key}")
+
+
+def _after(model, date_key, descending, cursor):
+    # Keyset predicate for the row after `cursor`: an id, or "<date>,<id>"
+    # when ordering by date (rows without a date are not part of that order)
+    try:
+        if date_key is None:
+            last_id = int(cursor)
+        else:
+            value, _, last_id = cursor.rpartition(",")
+            last_id = int(last_id)
+    except ValueError:
+        raise ListQueryError("after must be a cursor returned as next_cursor")
+
+    if date_key is None:
+        return model.id < last_id if descending else model.id > last_id
+
+    column = getattr(model, model.date_field)
+    value = parse_date(value)
+    if descending:
+        return or_(column < value, and_(column == value, model.id < last_id))
+    return or_(column > value, and_(column == value, model.id > last_id))
+
+
+def build_list_query(model, args, keys):
+    query = db.session.query(*columns_for(model, keys))
+
+    for param, attr in model.list_filters.items():
+        if param in args:
+            column = getattr(model, attr)
+            query = query.filter(column == coerce_value(column, args[param]))
+
+    if model.date_field:
+        column = getattr(model, model.date_field)
+        if "from" in args:
+            query = query.filter(column >= parse_date(args["from"]))
+        if "to" in args:
+            query = query.filter(column <= parse_date(args["to"]))
+
+    date_key, descending = ordering(model, args)
+    if "after" in args:
+        query = query.filter(_after(model, date_key, descending, args["after"]))
+
+    order = [model.id.desc() if descending else model.id]
+    if date_key is not None:
+        column = getattr(model, model.date_field)
+        query = query.filter(column.isnot(None))
+        order.insert(0, column.desc() if descending else column)
+    return query.order_by(*order)
+
+
+def next_cursor(item, date_key):
+    if date_key is None:
+        return item["id"]
+    return f"{item[date_key].isoformat()},{item['id']}"
+
+
+def list_records(model, key):
+    # Shared keyset-paginated listing:
+    # ?limit=&after=&fields=&order=&<filters>&from=&to=
+    args = request.args
+    try:
+        keys = selected_fields(model, args)
+        date_key, _ = ordering(model, args)
+        # The cursor needs the sort column as well as the id
+        if date_key is not None and date_key not in keys:
+            keys.append(date_key)
+        limit = page_limit(args)
+        query = build_list_query(model, args, keys)
+        rows = query.all() if limit is None else query.limit(limit + 1).all()
+    except ListQueryError as e:
+        return jsonify({"error": str(e)}), 400
+
+    has_more = limit is not None and len(rows) > limit
+    rows = rows[:limit]
+    items = encode_rows(model, keys, rows)
+
+    return jsonify({
+        key: items,
+        "count": len(items),
+        "next_cursor": next_cursor(items[-1], date_key) if has_more else None
+    })
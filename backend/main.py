@@ -1,35 +1,149 @@
-from flask import request, jsonify
+from flask import request, jsonify, g
 from config import app, db
 from models import User, Branche, Event, Alumni, News
+from stats import get_stats
+from listing import ListQueryError, list_records, parse_date
+from export import EXPORTABLE, export_table
+from bulk import bulk_write
+from auth import issue_token, token_required
+from migrations import upgrade
+from cache import cache, cached_json, cached_response
+from versions import conditional, record_response
+from serialization import fetch_record
+from search import search
+from events import branch_calendar, upcoming_events
+from feed import branch_feed, national_feed
+from changes import change_stream
+from batch import run_batch
+from analytics import alumni_analytics
+from patch import patch_record
+from counters import start_reconciler
+from jobs import enqueue, queue_stats, start_workers
+from metrics import render_metrics
+from ratelimit import admission_controlled, rate_limit
+import serve  # noqa: F401  (registers the `flask serve` command)
 
 
 @app.route("/api/health", methods=["GET"])
 def health_check():
     return jsonify({"status": "healthy", "message": "API is working"})
 
+# Response cache hit/miss counters
+@app.route("/cache/stats", methods=["GET"])
+def get_cache_stats():
+    return jsonify(cache.stats())
+
+# Background job queue depth and latency
+@app.route("/jobs/stats", methods=["GET"])
+def get_job_stats():
+    try:
+        return jsonify(queue_stats())
+    except Exception as e:
+        print("Error fetching job stats:", str(e))
+        return jsonify({"error": "Failed to fetch job stats"}), 500
+
+# Prometheus scrape endpoint for the per-route request metrics
+@app.route("/metrics", methods=["GET"])
+def get_metrics():
+    return render_metrics()
+
+# Feeds only cache their first page; later pages are rarely requested twice
+def first_page(**kwargs):
+    return "after" not in request.args
+
+def export_tables(table):
+    model = EXPORTABLE.get(table)
+    return [model.__tablename__] if model else []
+
+# Streaming bulk export: /export/<users|alumni|news>?format=ndjson|csv
+@app.route("/export/<string:table>", methods=["GET"])
+@conditional(export_tables)
+def export_records(table):
+    try:
+        return export_table(table)
+    except Exception as e:
+        print("Error exporting records:", str(e))
+        return jsonify({"error": "Failed to export records"}), 500
+
+# Batch create/update/upsert: POST /bulk/<users|branches|alumni|news>?mode=create|update|upsert
+@app.route("/bulk/<string:table>", methods=["POST"])
+@admission_controlled
+def bulk_records(table):
+    try:
+        return bulk_write(table)
+    except Exception as e:
+        print("Error in bulk write:", str(e))
+        return jsonify({"error": f"Database error: {str(e)}"}), 500
+
+# Ranked full-text search: /search?q=&kind=news,event,user,branch&branch_id=&limit=&offset=
+@app.route("/search", methods=["GET"])
+@conditional(["news", "event", "user", "branche"])
+def search_records():
+    try:
+        return search()
+    except Exception as e:
+        print("Error searching:", str(e))
+        return jsonify({"error": "Search failed"}), 500
+
+# Server-Sent Events feed of writes: /changes/stream?branch_id=1,2&kind=news,event&since=<seq>
+@app.route("/changes/stream", methods=["GET"])
+def stream_changes():
+    try:
+        return change_stream()
+    except Exception as e:
+        print("Error opening change stream:", str(e))
+        return jsonify({"error": "Failed to open change stream"}), 500
+
+# Several GET routes in one round trip: {"requests": ["/users", {"id": "b", "path": "/branches"}]}
+@app.route("/batch", methods=["POST"])
+def batch_requests():
+    try:
+        if not request.is_json:
+            return jsonify({"error": "Request must be JSON"}), 400
+        return run_batch()
+    except Exception as e:
+        print("Error running batch:", str(e))
+        return jsonify({"error": "Batch failed"}), 500
+
+# Dashboard aggregates computed with COUNT/GROUP BY instead of full-table dumps
+@app.route("/stats", methods=["GET"])
+@conditional(["user", "branche", "alumni", "event"], vary_seconds=app.config["STATS_CACHE_TTL"] or 1)
+def get_system_stats():
+    try:
+        fresh = request.args.get("fresh", "false").lower() in ("1", "true", "yes")
+        stats, cached = get_stats(fresh=fresh)
+        return jsonify({**stats, "cached": cached})
+    except Exception as e:
+        print("Error computing stats:", str(e))
+        return jsonify({"error": "Failed to compute stats"}), 500
+
 #User API(CRUD)
 @app.route("/users", methods=["GET"])
+@conditional(["user"])
 def get_users():
-    user = User.query.all()
-    json_user = list(map(lambda x: x.to_json(), user))
-    return jsonify({"users": json_user})
+    try:
+        return list_records(User, "users")
+    except Exception as e:
+        print("Error fetching users:", str(e))
+        return jsonify({"error": "Failed to fetch users"}), 500
 
 # GET single user by ID
 @app.route("/users/<int:user_id>", methods=["GET"])
 def get_user(user_id):
-    user = User.query.get(user_id)
+    user = fetch_record(User, user_id)
     if user:
-        return jsonify({"user": user.to_json()})
+        return record_response(User, user, lambda: jsonify({"user": user}))
     return jsonify({"error": "User not found"}), 404
 
 @app.route("/create_user", methods=["POST"])
+@rate_limit("RATELIMIT_SIGNUP", key="ip")
+@admission_controlled
 def create_user():
     try:
         if not request.is_json:
             return jsonify({"error": "Request must be JSON"}), 400
             
         data = request.get_json()
-        print("Received registration data:", data)
 
         # Validate required fields
         required_fields = ['name', 'email', 'password', 'role', 'branch_id']
@@ -57,6 +171,8 @@ def create_user():
         new_user.set_password(data.get('password'))
         
         db.session.add(new_user)
+        db.session.flush()
+        enqueue("welcome_email", {"user_id": new_user.id})
         db.session.commit()
         
         return jsonify({
@@ -77,6 +193,7 @@ def create_user():
 
 # UPDATE user
 @app.route("/users/<int:user_id>", methods=["PUT"])
+@admission_controlled
 def update_user(user_id):
     try:
         user = User.query.get(user_id)
@@ -121,6 +238,19 @@ def update_user(user_id):
         print("Error updating user:", str(e))
         return jsonify({"error": f"Database error: {str(e)}"}), 500
 
+# Partial update of the fields sent; the body carries the "version" that was read
+# (or If-Match with the GET ETag), and a record edited since then answers 409/412
+@app.route("/users/<int:user_id>", methods=["PATCH"])
+@admission_controlled
+def patch_user(user_id):
+    try:
+        payload, status = patch_record("users", user_id, "user")
+        return jsonify(payload), status
+    except Exception as e:
+        db.session.rollback()
+        print("Error patching user:", str(e))
+        return jsonify({"error": f"Database error: {str(e)}"}), 500
+
 @app.route("/delete_user/<int:user_id>", methods=["DELETE"])
 def delete_user(user_id):
     user = User.query.get(user_id)
@@ -137,11 +267,10 @@ def delete_user(user_id):
 
 # GET all branches
 @app.route("/branches", methods=["GET"])
+@cached_json(["branche"])
 def get_branches():
     try:
-        branches = Branche.query.all()
-        json_branches = list(map(lambda x: x.to_json(), branches))
-        return jsonify({"branches": json_branches})
+        return list_records(Branche, "branches")
     except Exception as e:
         print("Error fetching branches:", str(e))
         return jsonify({"error": "Failed to fetch branches"}), 500
@@ -150,9 +279,9 @@ def get_branches():
 @app.route("/branches/<int:branch_id>", methods=["GET"])
 def get_branch(branch_id):
     try:
-        branch = Branche.query.get(branch_id)
+        branch = fetch_record(Branche, branch_id)
         if branch:
-            return jsonify({"branch": branch.to_json()})
+            return record_response(Branche, branch, lambda: jsonify({"branch": branch}))
         return jsonify({"error": "Branch not found"}), 404
     except Exception as e:
         print("Error fetching branch:", str(e))
@@ -166,7 +295,6 @@ def create_branch():
             return jsonify({"error": "Request must be JSON"}), 400
             
         data = request.get_json()
-        print("Received branch data:", data)
 
         # Validate required fields based on your Branche model
         required_fields = ['name', 'university', 'province']
@@ -184,8 +312,9 @@ def create_branch():
             name=data.get('name'),
             university=data.get('university'),
             province=data.get('province'),
-            member_count=data.get('member_count', 0),  # Default to 0
-            alumni_count=data.get('alumni_count', 0)   # Default to 0
+            # Counts are maintained by triggers on user/alumni, never taken from the client
+            member_count=0,
+            alumni_count=0
         )
         
         db.session.add(new_branch)
@@ -223,10 +352,6 @@ def update_branch(branch_id):
             branch.university = data['university']
         if 'province' in data:
             branch.province = data['province']
-        if 'member_count' in data:
-            branch.member_count = data['member_count']
-        if 'alumni_count' in data:
-            branch.alumni_count = data['alumni_count']
         
         db.session.commit()
         
@@ -240,6 +365,17 @@ def update_branch(branch_id):
         print("Error updating branch:", str(e))
         return jsonify({"error": f"Database error: {str(e)}"}), 500
 
+# PATCH branch
+@app.route("/branches/<int:branch_id>", methods=["PATCH"])
+def patch_branch(branch_id):
+    try:
+        payload, status = patch_record("branches", branch_id, "branch")
+        return jsonify(payload), status
+    except Exception as e:
+        db.session.rollback()
+        print("Error patching branch:", str(e))
+        return jsonify({"error": f"Database error: {str(e)}"}), 500
+
 # DELETE branch
 @app.route("/delete_branch/<int:branch_id>", methods=["DELETE"])
 def delete_branch(branch_id):
@@ -271,11 +407,10 @@ def delete_branch(branch_id):
 #ALUMNI API(CRUD)
 # GET all alumni
 @app.route("/alumni", methods=["GET"])
+@conditional(["alumni"])
 def get_alumni():
     try:
-        alumni_list = Alumni.query.all()
-        json_alumni = list(map(lambda x: x.to_json(), alumni_list))
-        return jsonify({"alumni": json_alumni})
+        return list_records(Alumni, "alumni")
     except Exception as e:
         print("Error fetching alumni:", str(e))
         return jsonify({"error": "Failed to fetch alumni"}), 500
@@ -284,14 +419,25 @@ def get_alumni():
 @app.route("/alumni/<int:alumni_id>", methods=["GET"])
 def get_alumni_by_id(alumni_id):
     try:
-        alumni = Alumni.query.get(alumni_id)
+        alumni = fetch_record(Alumni, alumni_id)
         if alumni:
-            return jsonify({"alumni": alumni.to_json()})
+            return record_response(Alumni, alumni, lambda: jsonify({"alumni": alumni}))
         return jsonify({"error": "Alumni not found"}), 404
     except Exception as e:
         print("Error fetching alumni:", str(e))
         return jsonify({"error": "Failed to fetch alumni"}), 500
 
+# Alumni cohort counts from the precomputed rollup:
+# /analytics/alumni?group_by=province,year&branch_id=&province=&year=&year_from=&year_to=&degree=&status=
+@app.route("/analytics/alumni", methods=["GET"])
+@cached_json(["alumni_rollup", "branche"])
+def get_alumni_analytics():
+    try:
+        return alumni_analytics()
+    except Exception as e:
+        print("Error fetching alumni analytics:", str(e))
+        return jsonify({"error": "Failed to fetch alumni analytics"}), 500
+
 # CREATE alumni
 @app.route("/create_alumni", methods=["POST"])
 def create_alumni():
@@ -300,7 +446,6 @@ def create_alumni():
             return jsonify({"error": "Request must be JSON"}), 400
             
         data = request.get_json()
-        print("Received alumni data:", data)
 
         # Validate required fields based on your model
         required_fields = ['user_id', 'branch_id', 'degree']
@@ -374,6 +519,17 @@ def update_alumni(alumni_id):  # Fixed parameter name (was Alumni_id)
         print("Error updating alumni:", str(e))
         return jsonify({"error": f"Database error: {str(e)}"}), 500
 
+# PATCH alumni
+@app.route("/alumni/<int:alumni_id>", methods=["PATCH"])
+def patch_alumni(alumni_id):
+    try:
+        payload, status = patch_record("alumni", alumni_id, "alumni")
+        return jsonify(payload), status
+    except Exception as e:
+        db.session.rollback()
+        print("Error patching alumni:", str(e))
+        return jsonify({"error": f"Database error: {str(e)}"}), 500
+
 # DELETE alumni
 @app.route("/delete_alumni/<int:alumni_id>", methods=["DELETE"])
 def delete_alumni(alumni_id):
@@ -395,49 +551,89 @@ def delete_alumni(alumni_id):
 
 
 #Event API(CRUD)
+# ?branch_id=&from=&to=&order=date|-date|id|-id plus the shared list parameters
 @app.route("/events", methods=["GET"])
+@conditional(["event"])
 def get_events():
-    events = Event.query.all()
-    json_events = list(lambda x: x.to_json(), events)
-    return jsonify({"events": json_events})
+    try:
+        return list_records(Event, "events")
+    except Exception as e:
+        print("Error fetching events:", str(e))
+        return jsonify({"error": "Failed to fetch events"}), 500
+
+# Next ?limit= events of every branch (or of ?branch_id=1,2)
+@app.route("/events/upcoming", methods=["GET"])
+@conditional(["event"], vary_seconds=60)
+def get_upcoming_events():
+    try:
+        return upcoming_events()
+    except Exception as e:
+        print("Error fetching upcoming events:", str(e))
+        return jsonify({"error": "Failed to fetch upcoming events"}), 500
+
+# iCalendar feed per branch, cached until the branch's events change
+@app.route("/events/branch/<int:branch_id>/calendar.ics", methods=["GET"])
+@cached_response(["event", "branche"], ttl=86400, mimetype="text/calendar")
+def get_branch_calendar(branch_id):
+    try:
+        return branch_calendar(branch_id)
+    except Exception as e:
+        print("Error building branch calendar:", str(e))
+        return jsonify({"error": "Failed to build calendar"}), 500
 
 @app.route("/create_event", methods = ["POST"])
 def create_event():
-    title = request.json.get("title")
-    date = request.json.get("date")
-    branch_id = request.json.get("branchId")
-    created_by = request.json.get("createBy")
-    event_type = request.json.get("eventType")
+    data = request.get_json(silent=True) or {}
+    title = data.get("title")
+    date = data.get("date")
+    branch_id = data.get("branchId")
+    # "createBy" is still accepted from older clients
+    created_by = data.get("createdBy", data.get("createBy"))
+    event_type = data.get("eventType")
     
     if not title or not date or not branch_id or not created_by or not event_type:
         return (jsonify({"message": "You must include a title, date, branch id,created by, and event type."}), 
                 400)
+    try:
+        date = parse_date(str(date))
+    except ListQueryError as e:
+        return (jsonify({"message": str(e)}), 400)
+
     new_event = Event(title=title, date=date, branch_id=branch_id, created_by =created_by, event_type=event_type)
     try:
         db.session.add(new_event)
         db.session.commit()
     except Exception as e:
+        db.session.rollback()
         return (jsonify({"message":str(e)}), 400)
-    
-    return (jsonify({"message": "Event created"}), 201)
 
-@app.route("/update_event/<int:event_id>")
+    return (jsonify({"message": "Event created", "event": new_event.to_json()}), 201)
+
+@app.route("/update_event/<int:event_id>", methods=["PUT"])
 def update_event(event_id):
     event = Event.query.get(event_id)
 
     if not event:
         return jsonify({"message": "Event not found"}), 404
     
-    data = data.request.json
+    data = request.get_json(silent=True) or {}
+    try:
+        if "date" in data:
+            event.date = parse_date(str(data["date"]))
+    except ListQueryError as e:
+        return jsonify({"message": str(e)}), 400
     event.title = data.get("title", event.title)
-    event.date = data.get("title", event.date)
-    event.branch_id = data.get("title", event.branch_id)
-    event.created_by = data.get("title", event.created_by)
-    event.event_type = data.get("title", event.event_type)
+    event.branch_id = data.get("branchId", event.branch_id)
+    event.created_by = data.get("createdBy", event.created_by)
+    event.event_type = data.get("eventType", event.event_type)
 
-    db.session.commit()
+    try:
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"message": str(e)}), 400
 
-    return jsonify({"message": "Event updated"})
+    return jsonify({"message": "Event updated", "event": event.to_json()})
 
 @app.route("/delete_event/<int:event_id>", methods=["DELETE"])
 def delete_event(event_id):
@@ -447,19 +643,18 @@ def delete_event(event_id):
         return jsonify({"message": "Event not found!"}), 404
     
     db.session.delete(event)
-    db.commit()
+    db.session.commit()
 
-    return jsonify({"message": "Event deleted successful!"}), 201
+    return jsonify({"message": "Event deleted successful!"}), 200
 
 
 #News API(CRUD)
 # GET all news
 @app.route("/news", methods=["GET"])
+@conditional(["news"])
 def get_news():
     try:
-        news_list = News.query.all()
-        json_news = list(map(lambda x: x.to_json(), news_list))
-        return jsonify({"news": json_news})
+        return list_records(News, "news")
     except Exception as e:
         print("Error fetching news:", str(e))
         return jsonify({"error": "Failed to fetch news"}), 500
@@ -468,28 +663,34 @@ def get_news():
 @app.route("/news/<int:news_id>", methods=["GET"])
 def get_news_by_id(news_id):
     try:
-        news = News.query.get(news_id)
+        news = fetch_record(News, news_id)
         if news:
-            return jsonify({"news": news.to_json()})
+            return record_response(News, news, lambda: jsonify({"news": news}))
         return jsonify({"error": "News article not found"}), 404
     except Exception as e:
         print("Error fetching news:", str(e))
         return jsonify({"error": "Failed to fetch news article"}), 500
 
-# GET news by branch_id
+# GET news feed of a branch, newest first: ?limit=&after=<next_cursor>&fields=
 @app.route("/news/branch/<int:branch_id>", methods=["GET"])
+@cached_json(["news"], condition=first_page)
 def get_news_by_branch(branch_id):
     try:
-        news_list = News.query.filter_by(branch_id=branch_id).all()
-        json_news = list(map(lambda x: x.to_json(), news_list))
-        return jsonify({
-            "news": json_news,
-            "count": len(json_news)
-        })
+        return branch_feed(branch_id)
     except Exception as e:
         print("Error fetching news by branch:", str(e))
         return jsonify({"error": "Failed to fetch news articles"}), 500
 
+# GET national news feed, newest first, optionally ?branch_id=1,2,3
+@app.route("/news/feed", methods=["GET"])
+@cached_json(["news"], condition=first_page)
+def get_news_feed():
+    try:
+        return national_feed()
+    except Exception as e:
+        print("Error fetching news feed:", str(e))
+        return jsonify({"error": "Failed to fetch news feed"}), 500
+
 # CREATE news
 @app.route("/create_news", methods=["POST"])
 def create_news():
@@ -498,7 +699,6 @@ def create_news():
             return jsonify({"error": "Request must be JSON"}), 400
             
         data = request.get_json()
-        print("Received news data:", data)
 
         # Validate required fields
         required_fields = ['title', 'content', 'branch_id', 'author_id']
@@ -516,6 +716,8 @@ def create_news():
         )
         
         db.session.add(new_news)
+        db.session.flush()
+        enqueue("news_fanout", {"news_id": new_news.id})
         db.session.commit()
         
         return jsonify({
@@ -562,6 +764,17 @@ def update_news(news_id):
         print("Error updating news:", str(e))
         return jsonify({"error": f"Database error: {str(e)}"}), 500
 
+# PATCH news
+@app.route("/news/<int:news_id>", methods=["PATCH"])
+def patch_news(news_id):
+    try:
+        payload, status = patch_record("news", news_id, "news")
+        return jsonify(payload), status
+    except Exception as e:
+        db.session.rollback()
+        print("Error patching news:", str(e))
+        return jsonify({"error": f"Database error: {str(e)}"}), 500
+
 # DELETE news
 @app.route("/delete_news/<int:news_id>", methods=["DELETE"])
 def delete_news(news_id):
@@ -583,6 +796,9 @@ def delete_news(news_id):
     
 # Login 
 @app.route("/login", methods=["POST"])
+@rate_limit("RATELIMIT_LOGIN_IP", key="ip")
+@rate_limit("RATELIMIT_LOGIN_ACCOUNT", key="account")
+@admission_controlled
 def login():
     try:
         if not request.is_json:
@@ -605,23 +821,40 @@ def login():
         if not user.check_password(password):
             return jsonify({"error": "Invalid email or password"}), 401
 
+        # Upgrade hashes stored under an older method or cost
+        if user.password_needs_rehash():
+            user.set_password(password)
+            db.session.commit()
+
         # Check if user is active
         if user.status != 'active':
             return jsonify({"error": "Account is not active. Please contact administrator."}), 401
 
         # Login successful
+        token, expires_in = issue_token(user)
         return jsonify({
             "message": "Login successful",
             "user": user.to_json(),
-            "token": "your-jwt-token-here"  # Implement JWT if needed
+            "token": token,
+            "expires_in": expires_in
         }), 200
         
     except Exception as e:
+        db.session.rollback()
         print("Login error:", str(e))
         return jsonify({"error": "Internal server error"}), 500
     
+# Claims of the calling session, resolved from the token alone
+@app.route("/me", methods=["GET"])
+@token_required()
+def get_current_user():
+    return jsonify({"user": g.current_user})
+
 if __name__ == "__main__":
     with app.app_context():
-        db.create_all()
+        upgrade()
+    start_reconciler()
+    start_workers()
 
+    # Development server only; production runs `flask --app main serve` (serve.py)
     app.run(debug=True)
\ No newline at end of file
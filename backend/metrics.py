@@ -0,0 +1,152 @@
+import bisect
+import json
+import logging
+import threading
+import time
+
+from flask import Response, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from config import app
+
+
+# Per-process request instrumentation: latency, SQL statement count/time and
+# response size per route, exposed in the Prometheus text format at /metrics.
+# Requests issuing more than METRICS_NPLUS1_THRESHOLD statements are logged as
+# one JSON line each, which is usually an N+1 query pattern.
+logger = logging.getLogger("natesa.metrics")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets, labels):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self.labels = labels
+        # label values -> [bucket counts..., +Inf count, sum]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._series.items()]
+        for label_values, series in sorted(items):
+            labels = _labels(self.labels, label_values)
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series[:-1]):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{{{labels + ',' if labels else ''}{le}}} {cumulative}")
+            lines.append(f"{self.name}_sum{{{labels}}} {series[-1]:.6f}")
+            lines.append(f"{self.name}_count{{{labels}}} {cumulative}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text, labels):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._series[label_values] = self._series.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._series.items())
+        for label_values, value in items:
+            lines.append(f"{self.name}{{{_labels(self.labels, label_values)}}} {value}")
+        return lines
+
+
+def _labels(names, values):
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"') for v in values)
+    return ",".join(f'{n}="{v}"' for n, v in zip(names, escaped))
+
+
+REQUESTS = Counter("http_requests_total", "HTTP requests handled", ("method", "route", "status"))
+LATENCY = Histogram("http_request_duration_seconds", "Request latency", LATENCY_BUCKETS, ("method", "route"))
+SQL_QUERIES = Histogram("http_request_sql_queries", "SQL statements per request", QUERY_COUNT_BUCKETS, ("method", "route"))
+SQL_TIME = Histogram("http_request_sql_seconds", "SQL time per request", LATENCY_BUCKETS, ("method", "route"))
+RESPONSE_SIZE = Histogram("http_response_size_bytes", "Response body size", SIZE_BUCKETS, ("method", "route"))
+NPLUS1 = Counter("http_requests_nplus1_total", "Requests over the SQL statement threshold", ("method", "route"))
+
+METRICS = [REQUESTS, LATENCY, SQL_QUERIES, SQL_TIME, RESPONSE_SIZE, NPLUS1]
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._metrics_start = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and "metrics_start" in g:
+        g.sql_count += 1
+        g.sql_time += time.perf_counter() - context._metrics_start
+
+
+@app.before_request
+def _start_request_metrics():
+    g.metrics_start = time.perf_counter()
+    g.sql_count = 0
+    g.sql_time = 0.0
+
+
+@app.after_request
+def _record_request_metrics(response):
+    if "metrics_start" not in g:
+        return response
+
+    elapsed = time.perf_counter() - g.metrics_start
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    method = request.method
+
+    REQUESTS.inc(method, route, response.status_code)
+    LATENCY.observe(elapsed, method, route)
+    SQL_QUERIES.observe(g.sql_count, method, route)
+    SQL_TIME.observe(g.sql_time, method, route)
+    if response.content_length is not None:
+        RESPONSE_SIZE.observe(response.content_length, method, route)
+
+    threshold = app.config.get("METRICS_NPLUS1_THRESHOLD", 20)
+    if g.sql_count > threshold:
+        NPLUS1.inc(method, route)
+        logger.warning(json.dumps({
+            "event": "sql_query_threshold_exceeded",
+            "method": method,
+            "route": route,
+            "path": request.full_path,
+            "status": response.status_code,
+            "sql_queries": g.sql_count,
+            "sql_seconds": round(g.sql_time, 6),
+            "duration_seconds": round(elapsed, 6),
+            "threshold": threshold
+        }))
+    return response
+
+
+def render_metrics():
+    lines = []
+    for metric in METRICS:
+        lines += metric.render()
+    return Response("\n".join(lines) + "\n", mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,147 @@
+from datetime import datetime, timezone
+
+import click
+from sqlalchemy import inspect, text
+
+from config import app, db
+import models  # noqa: F401  (registers every table on db.metadata)
+from search import install_search, reindex_search
+from counters import install_counters
+from changes import install_change_log
+from analytics import install_rollup
+from patch import VERSIONED
+
+
+# Versioned schema steps applied in order. Each step must be safe to run on a
+# database that create_all() already brought up to the current models, since a
+# fresh install creates every table in step 1.
+def _create_tables(conn):
+    db.metadata.create_all(conn)
+
+
+def _create_indexes(conn):
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+
+
+def _event_calendar_index(conn):
+    # (branch_id, date) replaces the single-column branch_id index
+    _create_indexes(conn)
+    conn.exec_driver_sql("DROP INDEX IF EXISTS ix_event_branch_id")
+
+
+def _news_feed_indexes(conn):
+    # The feed indexes end in id so keyset pages need no sort on PostgreSQL
+    _create_indexes(conn)
+    conn.exec_driver_sql("DROP INDEX IF EXISTS ix_news_branch_id_publish_date")
+
+
+def _change_feed(conn):
+    _create_tables(conn)
+    install_change_log(conn)
+
+
+def _alumni_rollup(conn):
+    _create_tables(conn)
+    install_rollup(conn)
+
+
+def _edit_versions(conn):
+    # Edit version columns, and unique indexes in place of the pre-SELECT
+    # checks on branch names and per-user alumni records
+    inspector = inspect(conn)
+    for model in VERSIONED:
+        table = model.__tablename__
+        if "version" not in {c["name"] for c in inspector.get_columns(table)}:
+            conn.exec_driver_sql(f'ALTER TABLE "{table}" ADD COLUMN version INTEGER NOT NULL DEFAULT 1')
+
+    for table, column in (("branche", "name"), ("alumni", "user_id")):
+        duplicates = conn.exec_driver_sql(
+            f'SELECT {column} FROM "{table}" GROUP BY {column} HAVING COUNT(*) > 1').scalars().all()
+        if duplicates:
+            raise RuntimeError(f"Resolve duplicate {table}.{column} values first: {duplicates}")
+        conn.exec_driver_sql(f"DROP INDEX IF EXISTS ix_{table}_{column}")
+    _create_indexes(conn)
+
+
+def _widen_password_hash(conn):
+    # scrypt hashes are 162 characters; SQLite does not enforce VARCHAR lengths
+    if conn.dialect.name == "postgresql":
+        conn.exec_driver_sql('ALTER TABLE "user" ALTER COLUMN password_hash TYPE VARCHAR(255)')
+
+
+def _search_without_emails(conn):
+    # User documents were indexed with their email address as the body
+    reindex_search(conn, ["user"])
+
+
+MIGRATIONS = [
+    (1, "create tables", _create_tables),
+    (2, "hot lookup indexes", _create_indexes),
+    (3, "table version counters", _create_tables),
+    (4, "full-text search index", install_search),
+    (5, "branch member/alumni counters", install_counters),
+    (6, "background job queue", _create_tables),
+    (7, "event calendar index", _event_calendar_index),
+    (8, "news feed indexes", _news_feed_indexes),
+    (9, "change feed log", _change_feed),
+    (10, "alumni analytics rollup", _alumni_rollup),
+    (11, "edit versions and unique keys", _edit_versions),
+    (12, "widen password hashes", _widen_password_hash),
+    (13, "search index without emails", _search_without_emails),
+]
+
+
+def _ensure_version_table(conn):
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "version INTEGER PRIMARY KEY, "
+        "name VARCHAR(120) NOT NULL, "
+        "applied_at VARCHAR(40) NOT NULL)"
+    ))
+
+
+def applied_versions(conn):
+    if not inspect(conn).has_table("schema_migrations"):
+        return set()
+    return {row[0] for row in conn.execute(text("SELECT version FROM schema_migrations"))}
+
+
+def upgrade():
+    # Applies pending migrations, each in its own transaction; returns the versions applied
+    applied = []
+    with db.engine.begin() as conn:
+        _ensure_version_table(conn)
+        done = applied_versions(conn)
+
+    for version, name, step in MIGRATIONS:
+        if version in done:
+            continue
+        with db.engine.begin() as conn:
+            step(conn)
+            conn.execute(
+                text("INSERT INTO schema_migrations (version, name, applied_at) VALUES (:v, :n, :t)"),
+                {"v": version, "n": name, "t": datetime.now(timezone.utc).isoformat()}
+            )
+        applied.append(version)
+    return applied
+
+
+@app.cli.command("db-upgrade")
+def db_upgrade_command():
+    """Apply pending schema migrations."""
+    applied = upgrade()
+    if applied:
+        click.echo(f"Applied migrations: {', '.join(map(str, applied))}")
+    else:
+        click.echo("Database is up to date")
+
+
+@app.cli.command("db-status")
+def db_status_command():
+    """List schema migrations and whether they are applied."""
+    with db.engine.connect() as conn:
+        done = applied_versions(conn)
+    for version, name, _ in MIGRATIONS:
+        click.echo(f"{version:>4}  {'applied' if version in done else 'pending':<8} {name}")
@@ -1,63 +1,100 @@
 from config import db
 from datetime import datetime, timezone
-from werkzeug.security import generate_password_hash, check_password_hash
+from passwords import hash_password, verify_password, needs_rehash
 from sqlalchemy import Enum
 
 class User(db.Model):
-    
+    # branch_id lookups use the leftmost column of the (branch_id, status) index
+    __table_args__ = (db.Index('ix_user_branch_id_status', 'branch_id', 'status'),)
+
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(80), nullable=False)
     email = db.Column(db.String(80), unique=True, nullable=False)
-    password_hash = db.Column(db.String(120), nullable=False)
+    password_hash = db.Column(db.String(255), nullable=False)
     role = db.Column(db.String(80), nullable=False)
     branch_id = db.Column(db.Integer, nullable=False)
     is_bec_member = db.Column(db.String(80), nullable=True, default='no')
     bec_position = db.Column(db.String(80), nullable=True, default='no')
     nec_position = db.Column(db.String(80), nullable=False, default='N/A')  # Add this line
     status = db.Column(db.String(80), nullable=False, default='active')
+    # Bumped by every edit; PATCH requests must send the version they read
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+
+    # JSON key -> column attribute, used by the shared list endpoints
+    json_fields = {"id": "id", "name": "name", "email": "email", "role": "role",
+                   "branch_id": "branch_id", "is_bec_member": "is_bec_member",
+                   "nec_position": "nec_position", "bec_position": "bec_position",
+                   "status": "status", "version": "version"}
+    # Query parameter -> column attribute accepted as list filters
+    list_filters = {"branch_id": "branch_id", "status": "status", "role": "role"}
+    date_field = None
+    counter_fields = ()
     
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return verify_password(self.password_hash, password)
+
+    def password_needs_rehash(self):
+        return needs_rehash(self.password_hash)
 
     def to_json(self):
         return{"id": self.id,
                 "name": self.name,
                 "email": self.email,
-                "role": str(self.role),
+                "role": self.role,
                 "branch_id": self.branch_id,
-                "is_bec_member": str(self.is_bec_member),
-                "nec_position": str(self.nec_position),
-                "bec_position": str(self.bec_position),
-                "status": str(self.status)
+                "is_bec_member": self.is_bec_member,
+                "nec_position": self.nec_position,
+                "bec_position": self.bec_position,
+                "status": self.status,
+                "version": self.version
                 }
 
 class Branche(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    name =  db.Column(db.String(80), unique=False, nullable=False)
+    name =  db.Column(db.String(80), unique=True, nullable=False, index=True)
     university = db.Column(db.String(80), unique=False, nullable=False)
     province = db.Column(Enum('Eastern Cape', 'Free State', 'Gauteng', 'KwaZulu-Natal', 'Limpopo', 'Mpumalanga', 'Northern Cape', 'North West', 'Western Cape', 'draft', name='branch_province'), nullable=False, default='draft')
     member_count = db.Column(db.Integer, primary_key=False)
     alumni_count = db.Column(db.Integer, primary_key=False)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+
+    json_fields = {"id": "id", "name": "name", "university": "university",
+                   "province": "province", "member_count": "member_count",
+                   "alumni_count": "alumni_count", "version": "version"}
+    list_filters = {"province": "province", "university": "university"}
+    date_field = None
+    # Kept up to date by triggers (see counters.py), without a version bump
+    counter_fields = ("member_count", "alumni_count")
 
     def to_json(self):
         return{"id": self.id,
                 "name": self.name,
                 "university": self.university,
-                "province": str(self.province),
+                "province": self.province,
                 "member_count": self.member_count,
-                "alumni": self.alumni
+                "alumni_count": self.alumni_count,
+                "version": self.version
                 }
 
 class Alumni(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=False, nullable=False)
-    branch_id = db.Column(db.Integer, db.ForeignKey('branche.id'), primary_key=False, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=False, nullable=False, unique=True, index=True)
+    branch_id = db.Column(db.Integer, db.ForeignKey('branche.id'), primary_key=False, nullable=False, index=True)
     graduation_date = db.Column(db.DateTime, default=datetime.now(timezone.utc))
     degree = db.Column(db.String(80), unique=False, nullable=False)
     current_status = db.Column(Enum('active', 'cancelled', 'completed', 'draft', name='event_status'), nullable=False, default='draft')
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+
+    json_fields = {"id": "id", "user_id": "user_id", "branch_id": "branch_id",
+                   "graduation_date": "graduation_date", "degree": "degree",
+                   "current_status": "current_status", "version": "version"}
+    list_filters = {"branch_id": "branch_id", "user_id": "user_id",
+                    "status": "current_status", "degree": "degree"}
+    date_field = "graduation_date"
+    counter_fields = ()
 
     def to_json(self):
         return{"id": self.id,
@@ -66,9 +103,14 @@ class Alumni(db.Model):
                 "graduation_date": self.graduation_date,
                 "degree": self.degree,
                 "current_status": self.current_status,
+                "version": self.version
                 }
 
 class Event(db.Model):
+    # Calendar queries filter by branch and range/order by date; branch_id
+    # lookups use the leftmost column
+    __table_args__ = (db.Index('ix_event_branch_id_date', 'branch_id', 'date'),)
+
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(80), unique=False, nullable=False)
     date = db.Column(db.DateTime, default=datetime.now(timezone.utc))
@@ -76,6 +118,13 @@ class Event(db.Model):
     created_by =  db.Column(db.String(80), unique=False, nullable=False)
     event_type = db.Column(db.String(120), unique=False, nullable=False)
 
+    json_fields = {"id": "id", "title": "title", "date": "date",
+                   "branchId": "branch_id", "createdBy": "created_by",
+                   "eventType": "event_type"}
+    list_filters = {"branch_id": "branch_id", "event_type": "event_type",
+                    "created_by": "created_by"}
+    date_field = "date"
+
     def to_json(self):
         return{"id": self.id,
                 "title": self.title,
@@ -86,12 +135,24 @@ class Event(db.Model):
                 }
     
 class News(db.Model):
+    # Feeds read newest first by (publish_date, id), per branch and nationally
+    __table_args__ = (db.Index('ix_news_branch_id_publish_date_id', 'branch_id', 'publish_date', 'id'),
+                      db.Index('ix_news_publish_date_id', 'publish_date', 'id'))
+
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(80), unique=False, nullable=False)
     content = db.Column(db.String(80), unique=False, nullable=False)
     branch_id = db.Column(db.Integer, db.ForeignKey('branche.id'), primary_key=False, nullable=False)
     author_id = db.Column(db.String(120), unique=False, nullable=False)
-    publish_date = db.Column(db.DateTime, default=datetime.now(timezone.utc))
+    publish_date = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+
+    json_fields = {"id": "id", "title": "title", "content": "content",
+                   "branch_id": "branch_id", "author_id": "author_id",
+                   "publish_date": "publish_date", "version": "version"}
+    list_filters = {"branch_id": "branch_id", "author_id": "author_id"}
+    date_field = "publish_date"
+    counter_fields = ()
 
     def to_json(self):
         return{"id": self.id,
@@ -100,4 +161,73 @@ class News(db.Model):
                 "branch_id": self.branch_id,
                 "author_id": self.author_id,
                 "publish_date": self.publish_date,
-                }
\ No newline at end of file
+                "version": self.version
+                }
+class TableVersion(db.Model):
+    # Bumped in the same transaction as every write to `name`; drives HTTP validators
+    __tablename__ = 'table_versions'
+
+    name = db.Column(db.String(80), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False)
+
+class Job(db.Model):
+    # Persistent background job queue (see jobs.py); rows survive restarts
+    __tablename__ = 'jobs'
+    __table_args__ = (db.Index('ix_jobs_status_run_at', 'status', 'run_at'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(80), nullable=False)
+    payload = db.Column(db.Text, nullable=False, default='{}')
+    status = db.Column(Enum('queued', 'running', 'done', 'failed', name='job_status'), nullable=False, default='queued')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    run_at = db.Column(db.DateTime, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+
+    def to_json(self):
+        return{"id": self.id,
+                "kind": self.kind,
+                "status": self.status,
+                "attempts": self.attempts,
+                "max_attempts": self.max_attempts,
+                "run_at": self.run_at,
+                "created_at": self.created_at,
+                "last_error": self.last_error
+                }
+
+class Change(db.Model):
+    # Append-only change log written by triggers on the watched tables (see changes.py);
+    # seq never goes backwards, so it doubles as the SSE event id
+    __tablename__ = 'changes'
+    __table_args__ = {'sqlite_autoincrement': True}
+
+    seq = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(16), nullable=False)
+    op = db.Column(db.String(8), nullable=False)
+    record_id = db.Column(db.Integer, nullable=False)
+    branch_id = db.Column(db.Integer, nullable=True)
+    old_branch_id = db.Column(db.Integer, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False)
+
+    def to_json(self):
+        return{"seq": self.seq,
+                "kind": self.kind,
+                "op": self.op,
+                "id": self.record_id,
+                "branch_id": self.branch_id
+                }
+
+class AlumniRollup(db.Model):
+    # Alumni counts per (branch, graduation year, degree, status), kept current
+    # by triggers on alumni (see analytics.py); year 0 means no graduation date
+    __tablename__ = 'alumni_rollup'
+
+    branch_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    year = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    degree = db.Column(db.String(80), primary_key=True)
+    status = db.Column(db.String(16), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
@@ -0,0 +1,111 @@
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, generate_password_hash, check_password_hash
+
+from config import app
+
+
+# Hashing is CPU bound and holds the GIL, so it runs in a separate process pool.
+# The semaphore bounds in-flight work so a login spike queues here instead of
+# piling up unbounded inside the executor.
+_pool = None
+_pool_lock = threading.Lock()
+_slots = None
+
+
+def _get_pool():
+    global _pool, _slots
+
+    workers = app.config.get("PASSWORD_HASH_WORKERS", 0)
+    if workers <= 0:
+        return None
+
+    with _pool_lock:
+        if _pool is None:
+            context = multiprocessing.get_context(app.config.get("PASSWORD_HASH_MP_CONTEXT"))
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+            _slots = threading.BoundedSemaphore(workers * app.config.get("PASSWORD_HASH_QUEUE_FACTOR", 4))
+        return _pool
+
+
+def _submit(pool, fn, *args):
+    # The slot is held until the task itself finishes, not until the caller
+    # stops waiting, so timed-out work still counts against the bound
+    if not _slots.acquire(timeout=app.config.get("PASSWORD_HASH_TIMEOUT", 10)):
+        raise TimeoutError("Password hashing queue is full")
+    try:
+        future = pool.submit(fn, *args)
+    except BaseException:
+        _slots.release()
+        raise
+    future.add_done_callback(lambda _: _slots.release())
+    return future
+
+
+def _run(fn, *args):
+    pool = _get_pool()
+    if pool is None:
+        return fn(*args)
+    return _submit(pool, fn, *args).result(timeout=app.config.get("PASSWORD_HASH_TIMEOUT", 10))
+
+
+def hash_password(password):
+    return _run(generate_password_hash, password, app.config["PASSWORD_HASH_METHOD"])
+
+
+def hash_passwords(passwords):
+    # Bulk imports submit a whole chunk before waiting, so its hashes run in
+    # parallel on the pool; each task still holds a slot while queued
+    method = app.config["PASSWORD_HASH_METHOD"]
+    pool = _get_pool()
+    if pool is None:
+        return [generate_password_hash(password, method) for password in passwords]
+
+    futures = []
+    try:
+        for password in passwords:
+            futures.append(_submit(pool, generate_password_hash, password, method))
+        return [future.result(timeout=app.config.get("PASSWORD_HASH_TIMEOUT", 10)) for future in futures]
+    except BaseException:
+        for future in futures:
+            future.cancel()
+        raise
+
+
+def verify_password(password_hash, password):
+    return _run(check_password_hash, password_hash, password)
+
+
+def _method_parameters(method):
+    # werkzeug fills in defaults for short method strings and stores the
+    # expanded form ("scrypt" becomes "scrypt:32768:8:1"), so both sides are
+    # compared as (algorithm, parameters...) after the same expansion
+    name, *args = method.split(":")
+    if name == "scrypt":
+        return (name, *(map(int, args) if args else (2 ** 15, 8, 1)))
+    if name == "pbkdf2":
+        hash_name = args[0] if args else "sha256"
+        iterations = int(args[1]) if len(args) > 1 else DEFAULT_PBKDF2_ITERATIONS
+        return (name, hash_name, iterations)
+    return (name, *args)
+
+
+def needs_rehash(password_hash):
+    # Hashes look like "<method>$<salt>$<hash>"; anything stored under a
+    # different method or cost is upgraded on the next successful login
+    try:
+        stored = _method_parameters(password_hash.split("$", 1)[0])
+    except ValueError:
+        return True
+    return stored != _method_parameters(app.config["PASSWORD_HASH_METHOD"])
+
+
+def shutdown_pool():
+    global _pool
+
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True)
+            _pool = None
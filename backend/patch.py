@@ -0,0 +1,141 @@
+from flask import request
+from sqlalchemy import Enum, event, inspect, update
+from sqlalchemy.exc import IntegrityError
+
+from bulk import BULK_SPECS
+from config import db
+from listing import ListQueryError, coerce_value
+from models import User, Branche, Alumni, News
+from passwords import hash_password
+from serialization import columns_for, compile_encoder
+from versions import matches_row
+
+
+# Partial updates with optimistic concurrency: one
+# UPDATE ... SET ..., version = version + 1 WHERE id = ? AND version = ? RETURNING ...
+# per edit. Uniqueness is left to the table constraints, and a zero-row result
+# is told apart as 404 or 409 only after the fact. Editable fields are those of
+# the bulk endpoints.
+VERSIONED = (User, Branche, Alumni, News)
+# Changes that are not edits, e.g. password rehashes at login
+UNVERSIONED_ATTRIBUTES = {"version", "password_hash"}
+
+
+@event.listens_for(db.session, "before_flush")
+def _bump_versions(session, flush_context, instances):
+    # ORM edits (the PUT routes) move the version too, so PATCH sees them as conflicts
+    for obj in session.dirty:
+        if not isinstance(obj, VERSIONED):
+            continue
+        changed = {attr.key for attr in inspect(obj).attrs if attr.history.has_changes()}
+        if changed - UNVERSIONED_ATTRIBUTES:
+            obj.version = type(obj).version + 1
+
+
+class PatchError(ValueError):
+    pass
+
+
+class PreconditionFailed(PatchError):
+    pass
+
+
+def _expected_version(model, record_id, data):
+    # The version the client read: "version" in the body, or an If-Match with
+    # the row ETag of GET on the same URL (see row_etag). The UPDATE still
+    # guards against writes between the check and the update.
+    version = data.pop("version", None)
+    if version is not None:
+        try:
+            return int(version)
+        except (TypeError, ValueError):
+            raise PatchError("version must be an integer")
+
+    if_match = request.if_match
+    if not if_match:
+        return None
+    current = db.session.query(model.version).filter(model.id == record_id).scalar()
+    # A missing row falls through to the UPDATE's 404
+    if current is None:
+        return 0
+    if not matches_row(if_match, model, record_id, current):
+        raise PreconditionFailed("If-Match does not match the current ETag")
+    return current
+
+
+def _values(spec, data):
+    model = spec["model"]
+    fields = spec["fields"] + (["password"] if model is User else [])
+    unknown = [key for key in data if key not in fields]
+    if unknown:
+        raise PatchError(f"Fields cannot be changed: {', '.join(unknown)}")
+
+    values = {}
+    for field, value in data.items():
+        if field == "password":
+            if not isinstance(value, str) or not value:
+                raise PatchError("password must be a non-empty string")
+            values["password_hash"] = hash_password(value)
+            continue
+
+        column = getattr(model, field)
+        if value is None:
+            if not column.nullable:
+                raise PatchError(f"{field} cannot be null")
+        else:
+            try:
+                value = coerce_value(column, value)
+            except (ListQueryError, TypeError, AttributeError) as e:
+                raise PatchError(f"{field}: {e}")
+            if isinstance(column.type, Enum) and value not in column.type.enums:
+                raise PatchError(f"{field} must be one of: {', '.join(column.type.enums)}")
+        values[field] = value
+
+    if not values:
+        raise PatchError("No fields to update")
+    return values
+
+
+def patch_record(table, record_id, singular):
+    # Returns (payload, status)
+    spec = BULK_SPECS[table]
+    model = spec["model"]
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return {"error": "Request must be a JSON object"}, 400
+    data = dict(data)
+
+    try:
+        version = _expected_version(model, record_id, data)
+        if version is None:
+            return {"error": "version is required (in the body or an If-Match header)"}, 428
+        values = _values(spec, data)
+    except PreconditionFailed as e:
+        db.session.rollback()
+        return {"error": str(e)}, 412
+    except PatchError as e:
+        return {"error": str(e)}, 400
+
+    keys = tuple(model.json_fields)
+    statement = update(model) \
+        .where(model.id == record_id, model.version == version) \
+        .values(**values, version=model.version + 1) \
+        .returning(*columns_for(model, keys)) \
+        .execution_options(synchronize_session=False)
+    try:
+        row = db.session.execute(statement).first()
+        if row is None:
+            current = db.session.query(model.version).filter(model.id == record_id).scalar()
+            db.session.rollback()
+            if current is None:
+                return {"error": f"{singular.capitalize()} not found"}, 404
+            return {"error": f"{singular.capitalize()} was changed by someone else", "version": current}, 409
+        db.session.commit()
+    except IntegrityError as e:
+        db.session.rollback()
+        if "unique" in str(e.orig).lower():
+            field = spec["key"] if spec["key"] in values else "Value"
+            return {"error": f"{field} already in use"}, 409
+        return {"error": "Invalid reference or missing value"}, 400
+
+    return {singular: compile_encoder(model, keys)(row)}, 200
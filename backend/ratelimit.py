@@ -0,0 +1,242 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import request, jsonify
+
+from auth import InvalidToken, verify_token
+from config import app
+from metrics import METRICS, Counter
+
+
+# Token buckets: each key holds up to `capacity` tokens refilled at `rate` per
+# second; a request spends one token or is rejected with 429 and Retry-After.
+# Backends share one call, take(key, rate, capacity) -> (allowed, retry_after).
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+WRITE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+
+RATE_LIMITED = Counter("http_rate_limited_total", "Requests rejected by a rate limit", ("scope",))
+SHED = Counter("http_admission_shed_total", "Requests shed by the admission controller", ("reason",))
+METRICS += [RATE_LIMITED, SHED]
+
+
+def parse_limit(spec):
+    # "10/minute", "100/hour" or "5/30s" -> (tokens per second, capacity)
+    count, _, period = spec.partition("/")
+    seconds = PERIODS.get(period) or float(period.rstrip("s"))
+    return int(count) / seconds, int(count)
+
+
+class MemoryBucketBackend:
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, capacity):
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return allowed, 0.0 if allowed else (1 - tokens) / rate
+
+
+class SharedBucketBackend:
+    # Atomic refill-and-take in a Redis script, so every process and host
+    # draws from the same bucket; the server clock is used for refills
+    SCRIPT = """
+    local rate = tonumber(ARGV[1])
+    local capacity = tonumber(ARGV[2])
+    local clock = redis.call('TIME')
+    local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+    local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or capacity
+    local ts = tonumber(state[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+    local allowed = 0
+    if tokens >= 1 then
+        tokens = tokens - 1
+        allowed = 1
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+    redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+    return {allowed, tostring(tokens)}
+    """
+
+    def __init__(self, client, prefix="natesa:rl:"):
+        self.client = client
+        self.prefix = prefix
+        self._script = client.register_script(self.SCRIPT)
+
+    def take(self, key, rate, capacity):
+        allowed, tokens = self._script(keys=[self.prefix + key], args=[rate, capacity])
+        return bool(allowed), 0.0 if allowed else (1 - float(tokens)) / rate
+
+
+def _make_backend():
+    url = app.config.get("RATELIMIT_SHARED_URL")
+    if app.config.get("RATELIMIT_BACKEND") == "shared" and url:
+        import redis  # optional dependency, only needed for limits shared across processes
+        return SharedBucketBackend(redis.Redis.from_url(url))
+    return MemoryBucketBackend(app.config.get("RATELIMIT_MAX_KEYS", 100000))
+
+
+buckets = _make_backend()
+
+
+def client_ip():
+    # Behind a reverse proxy, wrap the app in werkzeug's ProxyFix so this is the client
+    return request.remote_addr or "unknown"
+
+
+def current_user_id():
+    header = request.headers.get("Authorization", "")
+    scheme, _, token = header.partition(" ")
+    if scheme.lower() == "bearer" and token:
+        try:
+            return verify_token(token.strip())["sub"]
+        except InvalidToken:
+            pass
+    return None
+
+
+def login_account():
+    data = request.get_json(silent=True) or {}
+    email = data.get("email")
+    return email.strip().lower() if isinstance(email, str) and email.strip() else None
+
+
+def user_or_ip():
+    user_id = current_user_id()
+    return f"user:{user_id}" if user_id is not None else f"ip:{client_ip()}"
+
+
+IDENTITIES = {
+    "ip": client_ip,
+    "user": user_or_ip,
+    "route": lambda: "*",
+    "account": login_account,
+}
+
+
+def _too_many(retry_after):
+    return jsonify({"error": "Too many requests, please retry later"}), 429, \
+        {"Retry-After": str(max(1, math.ceil(retry_after)))}
+
+
+def check_limit(setting, scope, identity):
+    # Returns a 429 response when the bucket for (scope, identity) is empty
+    spec = app.config.get(setting)
+    if not app.config.get("RATELIMIT_ENABLED", True) or not spec or identity is None:
+        return None
+    rate, capacity = parse_limit(spec)
+    allowed, retry_after = buckets.take(f"{scope}:{identity}", rate, capacity)
+    if allowed:
+        return None
+    RATE_LIMITED.inc(scope)
+    return _too_many(retry_after)
+
+
+def rate_limit(setting, key="ip", scope=None):
+    # `setting` names the config entry holding the limit ("10/minute");
+    # `key` is one of IDENTITIES or a callable returning the bucket identity
+    identity = IDENTITIES[key] if isinstance(key, str) else key
+
+    def decorator(view):
+        name = scope or f"{view.__name__}:{key if isinstance(key, str) else 'custom'}"
+
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            limited = check_limit(setting, name, identity())
+            if limited is not None:
+                return limited
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@app.before_request
+def _limit_writes():
+    # Every write endpoint gets a per-user (or per-IP) bucket per route
+    if request.method in WRITE_METHODS and request.endpoint:
+        return check_limit("RATELIMIT_WRITES", f"writes:{request.endpoint}", user_or_ip())
+
+
+class AdmissionController:
+    # Caps concurrent expensive requests per process. Up to `max_queue` callers
+    # wait at most `timeout` seconds for a slot; everyone else is shed at once.
+    def __init__(self, limit, max_queue, timeout):
+        self.limit = limit
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(limit)
+        self._lock = threading.Lock()
+        self.waiting = 0
+        self.in_flight = 0
+
+    def acquire(self):
+        # Returns None when admitted, otherwise the reason for shedding
+        if self._slots.acquire(blocking=False):
+            self._admitted()
+            return None
+        with self._lock:
+            if self.waiting >= self.max_queue:
+                return "queue_full"
+            self.waiting += 1
+        try:
+            if not self._slots.acquire(timeout=self.timeout):
+                return "timeout"
+        finally:
+            with self._lock:
+                self.waiting -= 1
+        self._admitted()
+        return None
+
+    def _admitted(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+
+def configure_admission():
+    # (Re)creates the controller from the config; `flask serve --threads`
+    # calls it after re-deriving the limits for its thread count
+    global admission
+    admission = AdmissionController(
+        app.config.get("ADMISSION_MAX_CONCURRENT", 6),
+        app.config.get("ADMISSION_MAX_QUEUE", 2),
+        app.config.get("ADMISSION_QUEUE_TIMEOUT", 2.0)
+    )
+
+
+configure_admission()
+
+
+def admission_controlled(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not app.config.get("ADMISSION_ENABLED", True):
+            return view(*args, **kwargs)
+        reason = admission.acquire()
+        if reason is not None:
+            SHED.inc(reason)
+            return jsonify({"error": "Server is busy, please retry later"}), 503, \
+                {"Retry-After": str(app.config.get("ADMISSION_RETRY_AFTER", 1))}
+        try:
+            return view(*args, **kwargs)
+        finally:
+            admission.release()
+    return wrapper
@@ -0,0 +1,202 @@
+from html import escape
+
+from flask import request, jsonify
+from sqlalchemy import text
+
+from config import app, db
+
+
+# Indexed sources: (kind, table, kind code, title column, body column, branch column).
+# Document ids are `row id * 4 + kind code`, so any row is reached by primary key.
+# Contact details such as email addresses are never indexed.
+SOURCES = [
+    ("news", "news", 0, "title", "content", "branch_id"),
+    ("event", "event", 1, "title", "event_type", "branch_id"),
+    ("user", "user", 2, "name", "role", "branch_id"),
+    ("branch", "branche", 3, "name", "university", "id"),
+]
+KINDS = [source[0] for source in SOURCES]
+
+# Match delimiters the database puts into snippets: private-use characters, so
+# the indexed text can be HTML-escaped before they become <mark> tags
+MARK_START, MARK_END = "\ue000", "\ue001"
+
+
+def _watched(*columns):
+    # Only updates to indexed columns re-index a row (e.g. not password rehashes)
+    return ", ".join(dict.fromkeys(("id",) + columns))
+
+
+def _sqlite_ddl():
+    statements = [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5("
+        "title, body, kind UNINDEXED, ref_id UNINDEXED, branch_id UNINDEXED, "
+        "tokenize='unicode61 remove_diacritics 2')"
+    ]
+    for kind, table, code, title, body, branch in SOURCES:
+        doc = f"{{row}}.id * 4 + {code}"
+        insert = (f"INSERT INTO search_index (rowid, title, body, kind, ref_id, branch_id) "
+                  f"VALUES ({doc.format(row='NEW')}, NEW.{title}, NEW.{body}, '{kind}', NEW.id, NEW.{branch});")
+        delete = f"DELETE FROM search_index WHERE rowid = {doc.format(row='OLD')};"
+        statements += [
+            f'CREATE TRIGGER IF NOT EXISTS search_{kind}_ai AFTER INSERT ON "{table}" BEGIN {insert} END',
+            f'CREATE TRIGGER IF NOT EXISTS search_{kind}_ad AFTER DELETE ON "{table}" BEGIN {delete} END',
+            f'CREATE TRIGGER IF NOT EXISTS search_{kind}_au AFTER UPDATE OF {_watched(title, body, branch)} '
+            f'ON "{table}" BEGIN {delete} {insert} END',
+            f"INSERT INTO search_index (rowid, title, body, kind, ref_id, branch_id) "
+            f"SELECT id * 4 + {code}, {title}, {body}, '{kind}', id, {branch} FROM \"{table}\" "
+            f"WHERE id * 4 + {code} NOT IN (SELECT rowid FROM search_index)",
+        ]
+    return statements
+
+
+def _postgresql_ddl():
+    statements = [
+        "CREATE TABLE IF NOT EXISTS search_documents ("
+        "doc_id BIGINT PRIMARY KEY, kind VARCHAR(16) NOT NULL, ref_id INTEGER NOT NULL, "
+        "branch_id INTEGER, title TEXT NOT NULL, body TEXT NOT NULL, "
+        "tsv tsvector GENERATED ALWAYS AS ("
+        "setweight(to_tsvector('simple', coalesce(title, '')), 'A') || "
+        "setweight(to_tsvector('simple', coalesce(body, '')), 'B')) STORED)",
+        "CREATE INDEX IF NOT EXISTS ix_search_documents_tsv ON search_documents USING GIN (tsv)",
+    ]
+    for kind, table, code, title, body, branch in SOURCES:
+        statements += [
+            f"CREATE OR REPLACE FUNCTION search_sync_{kind}() RETURNS trigger AS $$ BEGIN "
+            f"IF TG_OP IN ('UPDATE', 'DELETE') THEN "
+            f"DELETE FROM search_documents WHERE doc_id = OLD.id * 4 + {code}; END IF; "
+            f"IF TG_OP IN ('INSERT', 'UPDATE') THEN "
+            f"INSERT INTO search_documents (doc_id, kind, ref_id, branch_id, title, body) "
+            f"VALUES (NEW.id * 4 + {code}, '{kind}', NEW.id, NEW.{branch}, NEW.{title}, NEW.{body}); END IF; "
+            f"RETURN NULL; END $$ LANGUAGE plpgsql",
+            f'DROP TRIGGER IF EXISTS search_sync_{kind} ON "{table}"',
+            f'CREATE TRIGGER search_sync_{kind} AFTER INSERT OR DELETE OR UPDATE OF {_watched(title, body, branch)} '
+            f'ON "{table}" FOR EACH ROW EXECUTE FUNCTION search_sync_{kind}()',
+            f"INSERT INTO search_documents (doc_id, kind, ref_id, branch_id, title, body) "
+            f"SELECT id * 4 + {code}, '{kind}', id, {branch}, {title}, {body} FROM \"{table}\" "
+            f"ON CONFLICT (doc_id) DO NOTHING",
+        ]
+    return statements
+
+
+def install_search(conn):
+    # Creates the index, the sync triggers and backfills existing rows; idempotent
+    dialect = conn.dialect.name
+    if dialect == "sqlite":
+        statements = _sqlite_ddl()
+    elif dialect == "postgresql":
+        statements = _postgresql_ddl()
+    else:
+        raise RuntimeError(f"Full-text search is not supported on {dialect}")
+
+    for statement in statements:
+        conn.exec_driver_sql(statement)
+
+
+def reindex_search(conn, kinds):
+    # Drops the documents and triggers of `kinds` and rebuilds them from SOURCES
+    dialect = conn.dialect.name
+    for kind in kinds:
+        if dialect == "sqlite":
+            for suffix in ("ai", "ad", "au"):
+                conn.exec_driver_sql(f"DROP TRIGGER IF EXISTS search_{kind}_{suffix}")
+            conn.exec_driver_sql(f"DELETE FROM search_index WHERE kind = '{kind}'")
+        elif dialect == "postgresql":
+            conn.exec_driver_sql(f"DELETE FROM search_documents WHERE kind = '{kind}'")
+    install_search(conn)
+
+
+def _highlight(snippet):
+    return escape(snippet).replace(MARK_START, "<mark>").replace(MARK_END, "</mark>")
+
+
+def _fts5_query(terms):
+    # Quote every term so user input can never be parsed as FTS5 syntax;
+    # the last term matches as a prefix for search-as-you-type
+    tokens = ['"' + t.replace('"', '""') + '"' for t in terms.split()]
+    if tokens:
+        tokens[-1] += "*"
+    return " ".join(tokens)
+
+
+def _search_sqlite(terms, kinds, branch_id, limit, offset):
+    filters = ""
+    params = {"q": _fts5_query(terms), "start": MARK_START, "end": MARK_END, "limit": limit, "offset": offset}
+    if kinds:
+        filters += " AND kind IN (" + ", ".join(f":k{i}" for i in range(len(kinds))) + ")"
+        params.update({f"k{i}": k for i, k in enumerate(kinds)})
+    if branch_id is not None:
+        filters += " AND branch_id = :branch_id"
+        params["branch_id"] = branch_id
+
+    # bm25 weights: title matches count ten times as much as body matches
+    sql = text(
+        "SELECT kind, ref_id, branch_id, title, "
+        "snippet(search_index, -1, :start, :end, '…', 12) AS snippet, "
+        "bm25(search_index, 10.0, 1.0) AS score "
+        "FROM search_index WHERE search_index MATCH :q" + filters +
+        " ORDER BY score LIMIT :limit OFFSET :offset"
+    )
+    return [(kind, ref_id, branch, title, snippet, -score)
+            for kind, ref_id, branch, title, snippet, score in db.session.execute(sql, params)]
+
+
+def _search_postgresql(terms, kinds, branch_id, limit, offset):
+    filters = ""
+    params = {"q": terms, "limit": limit, "offset": offset,
+              "options": f"StartSel={MARK_START}, StopSel={MARK_END}, MaxWords=12, MinWords=4"}
+    if kinds:
+        filters += " AND kind = ANY(:kinds)"
+        params["kinds"] = list(kinds)
+    if branch_id is not None:
+        filters += " AND branch_id = :branch_id"
+        params["branch_id"] = branch_id
+
+    sql = text(
+        "SELECT kind, ref_id, branch_id, title, "
+        "ts_headline('simple', title || ' ' || body, query, :options) AS snippet, "
+        "ts_rank(tsv, query) AS score "
+        "FROM search_documents, websearch_to_tsquery('simple', :q) AS query "
+        "WHERE tsv @@ query" + filters +
+        " ORDER BY score DESC LIMIT :limit OFFSET :offset"
+    )
+    return list(db.session.execute(sql, params))
+
+
+def search():
+    terms = request.args.get("q", "").strip()
+    if not terms:
+        return jsonify({"error": "Query parameter q is required"}), 400
+
+    kinds = [k for k in request.args.get("kind", "").split(",") if k]
+    unknown = [k for k in kinds if k not in KINDS]
+    if unknown:
+        return jsonify({"error": f"Unknown kind: {', '.join(unknown)}"}), 400
+
+    try:
+        branch_id = int(request.args["branch_id"]) if "branch_id" in request.args else None
+        limit = min(int(request.args.get("limit", 20)), app.config.get("SEARCH_MAX_LIMIT", 100))
+        offset = int(request.args.get("offset", 0))
+    except ValueError:
+        return jsonify({"error": "branch_id, limit and offset must be integers"}), 400
+    if limit < 1 or offset < 0:
+        return jsonify({"error": "limit must be positive and offset non-negative"}), 400
+
+    backend = _search_postgresql if db.engine.dialect.name == "postgresql" else _search_sqlite
+    rows = backend(terms, kinds, branch_id, limit + 1, offset)
+
+    results = [{
+        "kind": kind,
+        "id": ref_id,
+        "branch_id": branch,
+        "title": title,
+        # Indexed text is user input: escaped, with only the match markers as HTML
+        "snippet": _highlight(snippet),
+        "score": round(float(score), 4)
+    } for kind, ref_id, branch, title, snippet, score in rows[:limit]]
+
+    return jsonify({
+        "results": results,
+        "count": len(results),
+        "next_offset": offset + limit if len(rows) > limit else None
+    })
@@ -0,0 +1,71 @@
+from datetime import date, datetime
+from functools import lru_cache
+
+from flask.json.provider import DefaultJSONProvider
+
+from config import app, db
+
+try:
+    import orjson
+except ImportError:  # optional: falls back to the stdlib-based provider
+    orjson = None
+
+
+@lru_cache(maxsize=None)
+def compile_encoder(model, keys):
+    # Validates the projection once per (model, keys); rows are column tuples
+    # in `keys` order, so encoding is a single dict(zip())
+    for key in keys:
+        if key not in model.json_fields:
+            raise KeyError(key)
+    return lambda row: dict(zip(keys, row))
+
+
+def columns_for(model, keys):
+    return [getattr(model, model.json_fields[k]) for k in keys]
+
+
+def encode_rows(model, keys, rows):
+    encoder = compile_encoder(model, tuple(keys))
+    return [encoder(row) for row in rows]
+
+
+def fetch_record(model, record_id, keys=None):
+    # Single-row lookup as a plain column tuple, bypassing the identity map
+    keys = tuple(keys or model.json_fields)
+    row = db.session.query(*columns_for(model, keys)).filter(model.id == record_id).first()
+    if row is None:
+        return None
+    return compile_encoder(model, keys)(row)
+
+
+class IsoJSONProvider(DefaultJSONProvider):
+    # Stdlib provider that writes datetimes as ISO 8601 instead of HTTP dates
+    @staticmethod
+    def default(o):
+        if isinstance(o, (datetime, date)):
+            return o.isoformat()
+        return DefaultJSONProvider.default(o)
+
+
+class OrjsonProvider(IsoJSONProvider):
+    # orjson encodes datetimes natively, in the same ISO form as IsoJSONProvider
+    option = orjson.OPT_NON_STR_KEYS if orjson else 0
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=IsoJSONProvider.default, option=self.option).decode()
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        body = orjson.dumps(obj, default=IsoJSONProvider.default, option=self.option)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def install_json_provider(flask_app):
+    provider = OrjsonProvider if orjson is not None and flask_app.config.get("JSON_FAST_PROVIDER", True) \
+        else IsoJSONProvider
+    flask_app.json_provider_class = provider
+    flask_app.json = provider(flask_app)
+
+
+install_json_provider(app)
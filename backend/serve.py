@@ -0,0 +1,386 @@
+import logging
+import os
+import random
+import select
+import signal
+import socket
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from importlib.util import find_spec
+
+import click
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+from config import admission_limits, app, db
+from counters import start_reconciler
+from jobs import start_workers, stop_workers
+from migrations import upgrade
+from ratelimit import configure_admission
+
+
+# Pre-fork server: the master applies migrations once, binds the listening
+# socket and forks the workers, which all accept() on that socket. A separate
+# background process runs the job queue and the counter reconciler so they are
+# not duplicated per worker. Signals: TERM/INT stop gracefully (a second one
+# kills), HUP replaces every worker.
+WORKER_BOOT_ERROR = 3
+
+
+def _log(message):
+    print(f"[serve {os.getpid()}] {message}", flush=True)
+
+
+def _parse_bind(bind):
+    host, _, port = bind.rpartition(":")
+    return (host.strip("[]") or "0.0.0.0"), int(port)
+
+
+def _listen(host, port, backlog):
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    return sock
+
+
+class _Handler(WSGIRequestHandler):
+    protocol_version = "HTTP/1.1"
+    stopping = None
+
+    def handle_one_request(self):
+        super().handle_one_request()
+        # Stop reusing keep-alive connections once the worker is shutting down
+        if self.stopping.is_set():
+            self.close_connection = True
+
+
+def _recycling(wsgi_app, limit, stopping, lock):
+    # Counts requests and asks the worker to exit once `limit` is reached
+    handled = 0
+
+    def wrapper(environ, start_response):
+        nonlocal handled
+        with lock:
+            handled += 1
+            if limit and handled >= limit and not stopping.is_set():
+                _log(f"Recycling worker after {handled} requests")
+                stopping.set()
+        return wsgi_app(environ, start_response)
+    return wrapper
+
+
+def _tracking(wsgi_app, started, lock):
+    # Records when each request entered the app. The body of a streamed
+    # response is not covered: event streams legitimately stay open for hours.
+    def wrapper(environ, start_response):
+        token = object()
+        with lock:
+            started[token] = time.time()
+        try:
+            return wsgi_app(environ, start_response)
+        finally:
+            with lock:
+                started.pop(token, None)
+    return wrapper
+
+
+def _beat(heartbeat, started, lock):
+    # Touches the heartbeat file and writes the start time of the oldest
+    # running request into it (0 when idle), for Arbiter.check_timeouts
+    with lock:
+        oldest = min(started.values(), default=0.0)
+    os.pwrite(heartbeat, f"{oldest:<20.6f}".encode(), 0)
+    os.utime(heartbeat)
+
+
+def _sync_worker(sock, options, heartbeat):
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopping.set())
+
+    handler = type("Handler", (_Handler,), {"timeout": options["keepalive"], "stopping": stopping})
+    host, port = sock.getsockname()[:2]
+    started, started_lock = {}, threading.Lock()
+    wsgi_app = _tracking(_recycling(app, options["max_requests"], stopping, threading.Lock()), started, started_lock)
+    server = BaseWSGIServer(host, port, wsgi_app, handler=handler, fd=sock.fileno())
+    server.multithread = True
+    server.socket.setblocking(False)
+
+    threads = options["threads"]
+    slots = threading.BoundedSemaphore(threads)
+    pool = ThreadPoolExecutor(threads, thread_name_prefix="http")
+
+    def serve_connection(conn, address):
+        try:
+            server.finish_request(conn, address)
+        except Exception:
+            server.handle_error(conn, address)
+        finally:
+            server.shutdown_request(conn)
+            slots.release()
+
+    # Only accept while a thread is free, so busy workers leave connections
+    # in the shared backlog for their siblings
+    while not stopping.is_set():
+        _beat(heartbeat, started, started_lock)
+        if not slots.acquire(timeout=1.0):
+            continue
+        try:
+            ready, _, _ = select.select([server.socket], [], [], 1.0)
+            conn, address = server.socket.accept() if ready else (None, None)
+        except (BlockingIOError, InterruptedError):
+            conn = None
+        if conn is None:
+            slots.release()
+            continue
+        conn.setblocking(True)
+        pool.submit(serve_connection, conn, address)
+
+    server.socket.close()
+    pool.shutdown(wait=True)
+
+
+def _gevent_worker(sock, options, heartbeat):
+    # Cooperative mode for I/O-bound endpoints: one event loop per worker
+    # serving up to SERVE_WORKER_CONNECTIONS concurrent requests
+    from gevent import monkey
+    monkey.patch_all()
+
+    import gevent
+    from gevent.event import Event
+    from gevent.lock import Semaphore
+    from gevent.pool import Pool
+    from gevent.pywsgi import WSGIServer
+
+    stopping = Event()
+    gevent.signal_handler(signal.SIGTERM, stopping.set)
+    started, started_lock = {}, Semaphore()
+    server = WSGIServer(sock, _tracking(_recycling(app, options["max_requests"], stopping, Semaphore()),
+                                        started, started_lock),
+                        spawn=Pool(options["worker_connections"]),
+                        log="default" if options["access_log"] else None)
+    server.start()
+    while not stopping.is_set():
+        _beat(heartbeat, started, started_lock)
+        stopping.wait(1.0)
+    server.stop(timeout=options["graceful_timeout"])
+
+
+def _background_worker(sock, options, heartbeat):
+    sock.close()
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopping.set())
+
+    start_reconciler()
+    start_workers()
+    while not stopping.is_set():
+        os.utime(heartbeat)
+        stopping.wait(1.0)
+    stop_workers(timeout=options["graceful_timeout"])
+
+
+WORKER_TYPES = {"sync": _sync_worker, "gevent": _gevent_worker}
+
+
+class Arbiter:
+    def __init__(self, options):
+        self.options = options
+        self.workers = {}  # pid -> (role, heartbeat fd)
+        self.stopping = False
+        self.force = False
+        self.reload = False
+        self.sock = None
+
+    def run(self):
+        # Schema changes happen once here, never concurrently in the workers
+        applied = upgrade()
+        if applied:
+            _log(f"Applied migrations: {', '.join(map(str, applied))}")
+        db.engine.dispose()
+
+        host, port = _parse_bind(self.options["bind"])
+        self.sock = _listen(host, port, self.options["backlog"])
+        _log(f"Listening on {host}:{self.sock.getsockname()[1]} with {self.options['workers']} "
+             f"{self.options['worker_class']} workers")
+
+        signal.signal(signal.SIGTERM, self._on_stop)
+        signal.signal(signal.SIGINT, self._on_stop)
+        signal.signal(signal.SIGHUP, self._on_reload)
+
+        for _ in range(self.options["workers"]):
+            self.spawn("web")
+        if self.options["background"]:
+            self.spawn("background")
+
+        exit_code = 0
+        while not self.stopping:
+            time.sleep(0.5)
+            if self.reload:
+                self.reload = False
+                _log("Reloading workers")
+                self.signal_all(signal.SIGTERM)
+            exit_code = self.reap()
+            if exit_code:
+                self.stopping = True
+                break
+            self.check_timeouts()
+            self.fill()
+
+        self.shutdown()
+        return exit_code
+
+    def _on_stop(self, signum, frame):
+        if self.stopping:
+            self.force = True
+        self.stopping = True
+
+    def _on_reload(self, signum, frame):
+        self.reload = True
+
+    def spawn(self, role):
+        heartbeat, path = tempfile.mkstemp(prefix="natesa-worker-")
+        os.unlink(path)
+        pid = os.fork()
+        if pid:
+            self.workers[pid] = (role, heartbeat)
+            return pid
+
+        # Child: never returns into the master's loop
+        code = 0
+        try:
+            for signum in (signal.SIGINT, signal.SIGHUP):
+                signal.signal(signum, signal.SIG_IGN)
+            random.seed()
+            # Connections opened by the master must not be shared across processes
+            db.engine.dispose(close=False)
+            target = _background_worker if role == "background" else WORKER_TYPES[self.options["worker_class"]]
+            options = dict(self.options)
+            if options["max_requests"]:
+                # Jitter keeps the workers from all recycling at the same moment
+                options["max_requests"] += random.randint(0, options["max_requests_jitter"])
+            _log(f"Booted {role} worker")
+            target(self.sock, options, heartbeat)
+        except Exception as e:
+            print(f"Error in {role} worker:", str(e), file=sys.stderr, flush=True)
+            code = WORKER_BOOT_ERROR
+        finally:
+            os._exit(code)
+
+    def fill(self):
+        web = sum(1 for role, _ in self.workers.values() if role == "web")
+        for _ in range(self.options["workers"] - web):
+            self.spawn("web")
+        if self.options["background"] and not any(role == "background" for role, _ in self.workers.values()):
+            self.spawn("background")
+
+    def reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return 0
+            if not pid:
+                return 0
+            role, heartbeat = self.workers.pop(pid, (None, None))
+            if heartbeat is not None:
+                os.close(heartbeat)
+            if os.WIFEXITED(status) and os.WEXITSTATUS(status) == WORKER_BOOT_ERROR:
+                _log(f"{role} worker {pid} failed; shutting down")
+                return 1
+
+    def check_timeouts(self):
+        # A worker is killed when its loop stops beating or when one of its
+        # requests has been running for longer than the timeout
+        timeout = self.options["timeout"]
+        if not timeout:
+            return
+        now = time.time()
+        for pid, (role, heartbeat) in list(self.workers.items()):
+            if now - os.fstat(heartbeat).st_mtime > timeout:
+                _log(f"{role} worker {pid} missed its heartbeat for {timeout}s; killing it")
+                self._kill(pid, signal.SIGKILL)
+                continue
+            oldest = os.pread(heartbeat, 20, 0).strip()
+            if oldest and 0 < float(oldest) < now - timeout:
+                _log(f"{role} worker {pid} has a request running for over {timeout}s; killing it")
+                self._kill(pid, signal.SIGKILL)
+
+    def signal_all(self, signum):
+        for pid in list(self.workers):
+            self._kill(pid, signum)
+
+    def _kill(self, pid, signum):
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            self.workers.pop(pid, None)
+
+    def shutdown(self):
+        _log("Shutting down")
+        self.sock.close()
+        self.signal_all(signal.SIGTERM)
+        deadline = time.monotonic() + self.options["graceful_timeout"]
+        while self.workers and time.monotonic() < deadline and not self.force:
+            self.reap()
+            time.sleep(0.1)
+        self.signal_all(signal.SIGKILL)
+        while self.workers:
+            try:
+                pid, _ = os.waitpid(-1, 0)
+            except ChildProcessError:
+                break
+            _, heartbeat = self.workers.pop(pid, (None, None))
+            if heartbeat is not None:
+                os.close(heartbeat)
+
+
+@app.cli.command("serve")
+@click.option("--bind", "-b", default=lambda: app.config["SERVE_BIND"], help="host:port to listen on.")
+@click.option("--workers", "-w", type=int, default=lambda: app.config["SERVE_WORKERS"],
+              help="Number of worker processes.")
+@click.option("--threads", type=int, default=lambda: app.config["SERVE_THREADS"],
+              help="Request threads per sync worker.")
+@click.option("--worker-class", type=click.Choice(sorted(WORKER_TYPES)),
+              default=lambda: app.config["SERVE_WORKER_CLASS"],
+              help="sync (thread pool) or gevent (async, for I/O-bound endpoints).")
+@click.option("--worker-connections", type=int, default=lambda: app.config["SERVE_WORKER_CONNECTIONS"],
+              help="Concurrent requests per gevent worker.")
+@click.option("--max-requests", type=int, default=lambda: app.config["SERVE_MAX_REQUESTS"],
+              help="Recycle a worker after this many requests (0 disables).")
+@click.option("--max-requests-jitter", type=int, default=lambda: app.config["SERVE_MAX_REQUESTS_JITTER"])
+@click.option("--timeout", type=int, default=lambda: app.config["SERVE_TIMEOUT"],
+              help="Kill workers silent for this many seconds (0 disables).")
+@click.option("--graceful-timeout", type=int, default=lambda: app.config["SERVE_GRACEFUL_TIMEOUT"],
+              help="Seconds workers get to finish in-flight requests on shutdown.")
+@click.option("--keepalive", type=int, default=lambda: app.config["SERVE_KEEPALIVE"],
+              help="Seconds an idle keep-alive connection is held open.")
+@click.option("--backlog", type=int, default=lambda: app.config["SERVE_BACKLOG"])
+@click.option("--background/--no-background", default=True,
+              help="Run the job queue and counter reconciler in a separate process.")
+@click.option("--access-log/--no-access-log", default=False)
+def serve_command(**options):
+    """Run the API with pre-forked worker processes."""
+    if options["worker_class"] == "gevent" and find_spec("gevent") is None:
+        raise click.UsageError("--worker-class gevent requires the gevent package")
+    if options["workers"] < 1 or options["threads"] < 1:
+        raise click.UsageError("--workers and --threads must be at least 1")
+    if not options["access_log"]:
+        logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    if options["threads"] != app.config["SERVE_THREADS"]:
+        # Admission limits are derived from the thread count (see config.py)
+        app.config["SERVE_THREADS"] = options["threads"]
+        app.config["ADMISSION_MAX_CONCURRENT"], app.config["ADMISSION_MAX_QUEUE"] = \
+            admission_limits(options["threads"])
+        configure_admission()
+
+    sys.exit(Arbiter(options).run())
+
+
+if __name__ == "__main__":
+    from flask.cli import ScriptInfo
+
+    import main  # noqa: F401  (registers the routes)
+    serve_command.main(obj=ScriptInfo(create_app=lambda: app))
@@ -0,0 +1,109 @@
+from datetime import datetime, timezone
+
+from sqlalchemy import case, func
+
+from cache import cache
+from config import app, db
+from models import User, Branche, Alumni, Event
+
+
+def _utcnow():
+    # Dates are stored naive (UTC) by SQLite, so compare against a naive UTC value
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def compute_stats():
+    now = _utcnow()
+
+    # One GROUP BY pass per table instead of downloading every row
+    user_rows = db.session.query(
+        User.branch_id,
+        func.count(User.id),
+        func.sum(case((User.status == 'active', 1), else_=0))
+    ).group_by(User.branch_id).all()
+
+    alumni_rows = db.session.query(
+        Alumni.branch_id,
+        func.count(Alumni.id)
+    ).group_by(Alumni.branch_id).all()
+
+    event_rows = db.session.query(
+        Event.branch_id,
+        func.count(Event.id),
+        func.sum(case((Event.date > now, 1), else_=0))
+    ).group_by(Event.branch_id).all()
+
+    branch_rows = db.session.query(Branche.id, Branche.name, Branche.province).all()
+
+    by_branch = {}
+
+    def branch_entry(branch_id):
+        if branch_id not in by_branch:
+            by_branch[branch_id] = {
+                "branch_id": branch_id,
+                "name": None,
+                "province": None,
+                "users": 0,
+                "activeUsers": 0,
+                "alumni": 0,
+                "events": 0,
+                "upcomingEvents": 0
+            }
+        return by_branch[branch_id]
+
+    for branch_id, name, province in branch_rows:
+        entry = branch_entry(branch_id)
+        entry["name"] = name
+        entry["province"] = str(province)
+
+    for branch_id, total, active in user_rows:
+        entry = branch_entry(branch_id)
+        entry["users"] = total
+        entry["activeUsers"] = int(active or 0)
+
+    for branch_id, total in alumni_rows:
+        branch_entry(branch_id)["alumni"] = total
+
+    for branch_id, total, upcoming in event_rows:
+        entry = branch_entry(branch_id)
+        entry["events"] = total
+        entry["upcomingEvents"] = int(upcoming or 0)
+
+    by_province = {}
+    for entry in by_branch.values():
+        province = entry["province"]
+        if province is None:
+            # Rows pointing at a branch that no longer exists
+            continue
+        totals = by_province.setdefault(province, {
+            "province": province,
+            "branches": 0,
+            "users": 0,
+            "activeUsers": 0,
+            "alumni": 0,
+            "events": 0,
+            "upcomingEvents": 0
+        })
+        totals["branches"] += 1
+        for key in ("users", "activeUsers", "alumni", "events", "upcomingEvents"):
+            totals[key] += entry[key]
+
+    branches = list(by_branch.values())
+    return {
+        "totalUsers": sum(e["users"] for e in branches),
+        "activeUsers": sum(e["activeUsers"] for e in branches),
+        "totalBranches": len(branch_rows),
+        "totalAlumni": sum(e["alumni"] for e in branches),
+        "totalEvents": sum(e["events"] for e in branches),
+        "upcomingEvents": sum(e["upcomingEvents"] for e in branches),
+        "byBranch": sorted(branches, key=lambda e: e["branch_id"]),
+        "byProvince": sorted(by_province.values(), key=lambda e: e["province"]),
+        "generated_at": now.isoformat()
+    }
+
+
+def get_stats(fresh=False):
+    ttl = app.config.get("STATS_CACHE_TTL", 0)
+    if fresh or ttl <= 0:
+        return compute_stats(), False
+    return cache.get_or_set("stats:system", compute_stats, ttl=ttl)
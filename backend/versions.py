@@ -0,0 +1,185 @@
+import hashlib
+import time
+from datetime import datetime, timezone
+from functools import wraps
+
+from flask import request, Response
+from sqlalchemy import event, insert, update
+from werkzeug.http import is_resource_modified
+
+from config import app, db
+from models import TableVersion
+
+
+UNTRACKED_TABLES = {TableVersion.__tablename__}
+
+# Tables whose rows are changed by database triggers when another table is written
+DEPENDENT_TABLES = {}
+
+# Callbacks run after a commit with the set of tables the transaction wrote
+_commit_listeners = []
+
+
+def register_dependent(table, dependent):
+    DEPENDENT_TABLES.setdefault(table, set()).add(dependent)
+
+
+def on_tables_committed(fn):
+    _commit_listeners.append(fn)
+    return fn
+
+
+def _utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def bump_tables(connection, tables):
+    # Runs on the writer's connection so the bump commits or rolls back with the write
+    tables = set(tables)
+    for name in list(tables):
+        tables |= DEPENDENT_TABLES.get(name, set())
+    tables = sorted(tables - UNTRACKED_TABLES)
+    if not tables:
+        return
+
+    now = _utcnow()
+    table = TableVersion.__table__
+    result = connection.execute(
+        update(table)
+        .where(table.c.name.in_(tables))
+        .values(version=table.c.version + 1, updated_at=now)
+    )
+    if result.rowcount < len(tables):
+        existing = {row[0] for row in connection.execute(
+            table.select().with_only_columns(table.c.name).where(table.c.name.in_(tables)))}
+        missing = [{"name": t, "version": 1, "updated_at": now} for t in tables if t not in existing]
+        if missing:
+            connection.execute(insert(table), missing)
+
+
+@event.listens_for(db.session, "after_flush")
+def _bump_after_flush(session, flush_context):
+    tables = {obj.__table__.name for obj in session.new}
+    tables |= {obj.__table__.name for obj in session.deleted}
+    tables |= {obj.__table__.name for obj in session.dirty if session.is_modified(obj)}
+    _record(session, tables)
+    bump_tables(session.connection(), tables)
+
+
+def _record(session, tables):
+    session.info.setdefault("written_tables", set()).update(tables)
+
+
+@event.listens_for(db.session, "after_commit")
+def _notify_after_commit(session):
+    tables = session.info.pop("written_tables", None)
+    if not tables:
+        return
+    for name in list(tables):
+        tables |= DEPENDENT_TABLES.get(name, set())
+    for listener in _commit_listeners:
+        listener(tables)
+
+
+@event.listens_for(db.session, "after_rollback")
+def _forget_after_rollback(session):
+    session.info.pop("written_tables", None)
+
+
+@event.listens_for(db.session, "do_orm_execute")
+def _bump_after_bulk(orm_execute_state):
+    # Bulk INSERT/UPDATE/DELETE statements bypass the flush
+    if not (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is not None:
+        _record(orm_execute_state.session, {mapper.local_table.name})
+        bump_tables(orm_execute_state.session.connection(), [mapper.local_table.name])
+
+
+def table_versions(tables):
+    rows = db.session.query(TableVersion.name, TableVersion.version, TableVersion.updated_at) \
+        .filter(TableVersion.name.in_(tables)).all()
+    return {name: (version, updated_at) for name, version, updated_at in rows}
+
+
+def version_etag(names, versions=None, vary_seconds=None):
+    # The (weak) ETag of the current URL at the given versions of `names`
+    if versions is None:
+        versions = table_versions(names)
+    parts = [request.full_path]
+    parts += [f"{name}:{versions.get(name, (0, None))[0]}" for name in sorted(names)]
+    if vary_seconds:
+        parts.append(str(int(time.time() // vary_seconds)))
+    return hashlib.sha1("|".join(parts).encode()).hexdigest()
+
+
+def respond(names, build, vary_seconds=None):
+    # Reads the versions of `names` once, answers If-None-Match with 304 from
+    # them, and otherwise calls build(etag) for the response. The etag covers
+    # the request path and the versions, so a cache keyed on it can never pair
+    # a body with another version's ETag.
+    versions = table_versions(names)
+    etag = version_etag(names, versions, vary_seconds)
+
+    stamps = [updated_at for _, updated_at in versions.values() if updated_at]
+    last_modified = max(stamps).replace(tzinfo=timezone.utc) if stamps and not vary_seconds else None
+
+    # Only the ETag decides (RFC 9110 13.2.2): Last-Modified has one-second
+    # resolution, so If-Modified-Since alone would hide a write made in the
+    # same second as the client's copy. It is still sent for caches and logs.
+    if not is_resource_modified(request.environ, etag=etag):
+        response = Response(status=304)
+    else:
+        response = build(etag)
+        if response.status_code != 200:
+            return response
+
+    response.set_etag(etag, weak=True)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.cache_control.no_cache = True
+    return response
+
+
+def conditional(tables, vary_seconds=None):
+    # Answers conditional requests from the table version counters alone,
+    # before the view queries or serializes anything.
+    # `tables` is a list of table names or a callable receiving the URL arguments;
+    # `vary_seconds` adds a time bucket for responses that also depend on the clock.
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            names = tables(**kwargs) if callable(tables) else tables
+            return respond(names, lambda etag: app.make_response(view(*args, **kwargs)), vary_seconds)
+        return wrapper
+    return decorator
+
+
+def row_etag(model, record_id, version, counters=()):
+    # ETag of one row of a versioned table: its edit version, then any counter
+    # columns after a dot. PATCH matches If-Match on the version part only, so
+    # writes to other rows, or counter updates, never fail a precondition.
+    tag = f"{model.__tablename__}-{record_id}-v{version}"
+    if counters:
+        tag += "." + "-".join(str(value) for value in counters)
+    return tag
+
+
+def matches_row(if_match, model, record_id, version):
+    tag = row_etag(model, record_id, version)
+    return if_match.star_tag or any(
+        value == tag or value.startswith(tag + ".") for value in if_match.as_set(include_weak=True))
+
+
+def record_response(model, record, build):
+    # Detail GET of a record fetched by fetch_record(): the ETag comes from the
+    # row itself (row_etag), so it only changes when the row does
+    etag = row_etag(model, record["id"], record["version"], [record[k] for k in model.counter_fields])
+    if not is_resource_modified(request.environ, etag=etag):
+        response = Response(status=304)
+    else:
+        response = app.make_response(build())
+    response.set_etag(etag, weak=True)
+    response.cache_control.no_cache = True
+    return response